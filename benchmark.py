@@ -0,0 +1,926 @@
+import argparse
+import concurrent.futures
+import heapq
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import fuzzy_matching
+import image_cache
+from puzzle_catalog import PuzzleCatalog, read_catalog
+from puzzle_matching import NO_PREFERENCE, QUESTIONS
+from puzzle_search import SearchIndex
+from review_similarity import ItemSimilarity, blend
+from review_dedup import DUPLICATE_CUTOFF, DuplicateDetector, buckets, normalize
+import review_store
+from review_store import ReviewStore
+
+# a few misspelled attribute values, like the ones in the real catalog
+TYPOS = {"Colourful": "Colorful", "Realistic": "Realisitc"}
+
+
+# words for the names of the random puzzles, like the German names of the real catalog
+NAME_WORDS = ["Leuchtturm", "Wasserfall", "Berge", "Wüste", "Dünen", "Lavendelfeld", "Unterwasserwelt", "Hafen",
+              "Sonnenuntergang", "Regenbogen", "Schloss", "Wald", "Insel", "Dorf", "Stadt", "Winter", "Sommer",
+              "Magische", "Geheimnisvolle", "Zauberhafte", "Island", "Mexiko", "Norwegen", "Italien", "Japan"]
+
+
+# create a catalog with n random puzzles that look like the ones on the preference page
+def make_puzzles(n, seed=42):
+    rng = random.Random(seed)
+    names = random.Random(seed + 1)
+    puzzles = []
+    for number in range(n):
+        attributes = []
+        for _, _, options in QUESTIONS:
+            value = rng.choice(options)
+            if value in TYPOS and rng.random() < 0.3:
+                value = TYPOS[value]
+            attributes.append(value)
+        puzzles.append({
+            "name": " ".join(names.sample(NAME_WORDS, 3) + [str(10000000 + number)]),
+            "image_url": f"https://example.com/{number}.jpg",
+            "attributes": attributes,
+        })
+    return puzzles
+
+
+# random answers to the six questions
+def make_preferences(count, seed=7):
+    rng = random.Random(seed)
+    return [[rng.choice(options) for _, _, options in QUESTIONS] for _ in range(count)]
+
+
+# the find_best_puzzle loop as it was before the matching engine, kept here as the baseline
+def legacy_find_best_puzzle(user_preferences, puzzles, threshold=70):
+    best_match = None
+    highest_score = 0
+
+    for puzzle in puzzles:
+        scores = [fuzzy_matching.ratio(user_attr, puzzle_attr) for user_attr, puzzle_attr in
+                  zip(user_preferences, puzzle["attributes"])]
+        avg_score = sum(scores) / len(scores)
+
+        if avg_score > highest_score and avg_score >= threshold:
+            highest_score = avg_score
+            best_match = puzzle
+
+    return best_match, highest_score
+
+
+# run a function a few times and return the fastest time in milliseconds
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+# compare the old loop with the matching engine, also with weights and a question without preference
+def bench_matching(sizes, repeat):
+    print(f"{'puzzles':>10} {'build ms':>10} {'loop ms':>10} {'engine ms':>10} {'speedup':>8} {'weighted ms':>12}")
+    for size in sizes:
+        puzzles = make_puzzles(size)
+        preferences = make_preferences(repeat)
+
+        start = time.perf_counter()
+        matcher = PuzzleCatalog.from_records(puzzles).matcher
+        build = (time.perf_counter() - start) * 1000
+
+        loop = best_time(lambda: legacy_find_best_puzzle(preferences[0], puzzles), repeat)
+        engine = best_time(lambda: matcher.find_best_puzzle(preferences[0]), repeat)
+        answers = dict(zip(matcher.keys, preferences[0]), detail=NO_PREFERENCE)
+        weighted = best_time(lambda: matcher.find_best_puzzle(answers, weights={"style": 3, "colours": 2}), repeat)
+        print(f"{size:>10} {build:>10.1f} {loop:>10.2f} {engine:>10.2f} {loop / engine:>7.0f}x {weighted:>12.2f}")
+
+
+# top-k ranking with explanations compared to a bounded heap and a full sort of the scores
+def bench_ranking(sizes, k, repeat):
+    print(f"{'puzzles':>10} {'rank ms':>10} {'heapq ms':>10} {'sort ms':>10}   (k={k})")
+    for size in sizes:
+        matcher = PuzzleCatalog.from_records(make_puzzles(size)).matcher
+        preferences = make_preferences(1)[0]
+        scores = matcher.scores(preferences)
+
+        # many puzzles share a profile and with it the score, ties have to stay in catalog order like in a stable
+        # sort, and the best match has to be the one the old loop found
+        for answers in make_preferences(50, seed=size):
+            expected = np.argsort(-matcher.scores(answers), kind="stable")[:k].tolist()
+            ranking = [row for row, _, _ in matcher.rank(answers, k=k)]
+            assert ranking == expected[:len(ranking)], "tied puzzles are not in catalog order"
+            assert matcher.find_best_puzzle(answers, threshold=0)[0] == ranking[0], "rank and find_best_puzzle differ"
+
+        ranked = best_time(lambda: matcher.rank(preferences, k=k), repeat)
+        heap = best_time(lambda: heapq.nlargest(k, range(len(scores)), key=scores.__getitem__), repeat)
+        full = best_time(lambda: sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k], repeat)
+        print(f"{size:>10} {ranked:>10.2f} {heap:>10.2f} {full:>10.2f}")
+
+
+# the recommendation cache: time to precompute all combinations of answers and the time of a cached lookup
+def bench_recommendations(sizes, k, repeat):
+    print(f"{'puzzles':>10} {'precompute ms':>14} {'rank ms':>10} {'cached us':>10} {'hit rate':>9}")
+    for size in sizes:
+        catalog = PuzzleCatalog.from_records(make_puzzles(size))
+        cache = catalog.recommendations
+        cache.precompute(k=k, threshold=70)
+
+        preferences = make_preferences(1000)
+        uncached = best_time(lambda: catalog.matcher.rank(preferences[0], k=k, threshold=70), repeat)
+        start = time.perf_counter()
+        for answers in preferences:
+            cache.rank(answers, k=k, threshold=70)
+        cached = (time.perf_counter() - start) * 1_000_000 / len(preferences)
+        report = cache.report()
+        print(f"{size:>10} {report['precompute_ms']:>14.0f} {uncached:>10.2f} {cached:>10.2f} {report['hit_rate']:>9.1%}")
+
+
+# load time and memory of the catalog from a CSV file compared to the old list of dicts
+def bench_catalog(sizes, directory):
+    print(f"{'puzzles':>10} {'load ms':>10} {'catalog MB':>11} {'dicts MB':>10} {'lookup us':>10}")
+    for size in sizes:
+        puzzles = make_puzzles(size)
+        path = os.path.join(directory, f"catalog_{size}.csv")
+        PuzzleCatalog.from_records(puzzles).frame.drop(columns="item_number").to_csv(path, index=False)
+
+        start = time.perf_counter()
+        catalog = read_catalog(path)
+        load = (time.perf_counter() - start) * 1000
+
+        catalog_size = catalog.frame.memory_usage(deep=True).sum() + catalog.matcher.codes.nbytes
+        dicts_size = sum(sys.getsizeof(puzzle) + sys.getsizeof(puzzle["attributes"]) + sys.getsizeof(puzzle["name"])
+                         + sys.getsizeof(puzzle["image_url"]) for puzzle in puzzles)
+
+        numbers = [puzzle["name"].rsplit(" ", 1)[1] for puzzle in puzzles[::max(size // 1000, 1)]]
+        start = time.perf_counter()
+        for number in numbers:
+            catalog.find(number)
+        lookup = (time.perf_counter() - start) * 1_000_000 / len(numbers)
+        print(f"{size:>10} {load:>10.1f} {catalog_size / 2**20:>11.1f} {dicts_size / 2**20:>10.1f} {lookup:>10.2f}")
+
+
+# the search box: time to build the index and query latency compared to a fuzzy scan over all names
+def bench_search(sizes, repeat):
+    rng = random.Random(3)
+    print(f"{'puzzles':>10} {'index ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'scan ms':>8}")
+    for size in sizes:
+        catalog = PuzzleCatalog.from_records(make_puzzles(size))
+        start = time.perf_counter()
+        index = SearchIndex(catalog)
+        build = (time.perf_counter() - start) * 1000
+
+        # words, words with a typo, attributes and item numbers
+        queries = []
+        for _ in range(100):
+            word = rng.choice(NAME_WORDS)
+            typo = rng.randrange(1, len(word))
+            queries += [f"{word} {rng.choice(NAME_WORDS)}", word[:typo] + word[typo + 1:],
+                        f"{rng.choice(NAME_WORDS)} ocean", str(10000000 + rng.randrange(size))]
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            times.append((time.perf_counter() - start) * 1000)
+            # every query only once, not from the query cache
+            index._results.clear()
+
+        names = list(catalog.frame["name"])
+        scan = best_time(lambda: fuzzy_matching.extract(queries[0], names, limit=10), repeat)
+        print(f"{size:>10} {build:>9.0f} {percentile(times, 0.5):>8.2f} {percentile(times, 0.95):>8.2f} {scan:>8.1f}")
+
+
+# joining reviews to their puzzles: the catalog index compared to a dict lookup per review, pd.merge and a scan of
+# the catalog per review like the old list of puzzles needed
+def bench_join(puzzles, reviews, repeat):
+    catalog = PuzzleCatalog.from_records(make_puzzles(puzzles))
+    rng = random.Random(9)
+    numbers = list(catalog.by_item_number)
+    # a few reviews are of puzzles that are not in the catalog
+    item_numbers = pd.Series([rng.choice(numbers) if rng.random() > 0.05 else "999" for _ in range(reviews)])
+    frame = pd.DataFrame({"Item Number": item_numbers})
+
+    index = best_time(lambda: catalog.details(item_numbers), repeat)
+    names = catalog.frame["name"]
+    lookup = best_time(lambda: [names.iat[catalog.by_item_number[number]] if number in catalog.by_item_number
+                                else "" for number in item_numbers], repeat)
+    puzzles_frame = catalog.frame[["item_number", "name", "image_url"]]
+    merge = best_time(lambda: frame.merge(puzzles_frame, how="left", left_on="Item Number", right_on="item_number"),
+                      repeat)
+
+    # the scan is far too slow for all reviews, so it is measured for a few and scaled up
+    sample = list(item_numbers[:20])
+    records = [catalog.puzzle(row) for row in range(len(catalog))]
+    start = time.perf_counter()
+    for number in sample:
+        next((puzzle for puzzle in records if puzzle["item_number"] == number), None)
+    scan = (time.perf_counter() - start) * 1000 * reviews / len(sample)
+
+    print(f"{reviews} reviews x {puzzles} puzzles")
+    print(f"catalog index (get_indexer): {index:>10.1f} ms")
+    print(f"dict lookup per review:      {lookup:>10.1f} ms")
+    print(f"pd.merge:                    {merge:>10.1f} ms")
+    print(f"catalog scan per review:     {scan:>10.0f} ms (estimated from {len(sample)} reviews)")
+    page = best_time(lambda: catalog.details(item_numbers[:20]), repeat)
+    print(f"one page of 20 reviews:      {page:>10.3f} ms")
+
+
+# "users like you": building the item similarities from reviews and blending them into the recommendations
+# the people belong to taste groups and mostly give good stars to the puzzles of their group, so the neighbours of a
+# puzzle should be puzzles of the same group
+def bench_collaborative(puzzles, review_counts, repeat):
+    catalog = PuzzleCatalog.from_records(make_puzzles(puzzles))
+    numbers = list(catalog.by_item_number)
+    rng = random.Random(11)
+    groups = 50
+    group_of = {number: rng.randrange(groups) for number in numbers}
+    by_group = {}
+    for number, group in group_of.items():
+        by_group.setdefault(group, []).append(number)
+
+    print(f"{'reviews':>8} {'people':>7} {'build ms':>9} {'pairs':>10} {'memory MB':>10} {'same group':>11} "
+          f"{'blend p50 ms':>13} {'p95 ms':>7} {'rank ms':>8}")
+    for count in review_counts:
+        people = max(count // 20, 1)
+        names, items, stars = [], [], []
+        for _ in range(count):
+            person = rng.randrange(people)
+            names.append(f"Person {person}")
+            if rng.random() < 0.7:
+                items.append(rng.choice(by_group[person % groups]))
+                stars.append(rng.randint(4, 5))
+            else:
+                items.append(rng.choice(numbers))
+                stars.append(rng.randint(1, 3))
+
+        before = peak_rss()
+        start = time.perf_counter()
+        similarity = ItemSimilarity.from_reviews(items, names, stars)
+        build = (time.perf_counter() - start) * 1000
+        memory = peak_rss() - before
+
+        sample = rng.sample(numbers, min(200, len(numbers)))
+        found = [(group_of[number], similarity.neighbours(number)[0][:10]) for number in sample]
+        same = [group_of[other] == group for group, others in found for other in others]
+
+        preferences = make_preferences(200)
+        for answers in preferences:
+            catalog.recommendations.rank(answers, k=5, threshold=70)
+        latencies = []
+        for number, answers in enumerate(preferences):
+            start = time.perf_counter()
+            blend(catalog, similarity, answers, k=5, threshold=70, name=f"Person {number % people}")
+            latencies.append((time.perf_counter() - start) * 1000)
+        rank = best_time(lambda: [catalog.recommendations.rank(answers, k=5, threshold=70) for answers in preferences],
+                         repeat) / len(preferences)
+        print(f"{count:>8} {people:>7} {build:>9.0f} {similarity.pairs:>10} {memory:>10.0f} "
+              f"{sum(same) / max(len(same), 1):>11.0%} {percentile(latencies, 0.5):>13.3f} "
+              f"{percentile(latencies, 0.95):>7.3f} {rank:>8.3f}")
+
+
+# value at a percentile of a list of numbers
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+# the old way of saving reviews: a one-row DataFrame concatenated onto all earlier reviews
+def bench_concat(count):
+    reviews = pd.DataFrame(columns=["Item Number", "Name", "Stars", "Comment"])
+    start = time.perf_counter()
+    for number in range(count):
+        new_review = pd.DataFrame([{"Item Number": str(number), "Name": "Bench", "Stars": 5, "Comment": "Great"}])
+        reviews = pd.concat([reviews, new_review], ignore_index=True)
+    return (time.perf_counter() - start) * 1000
+
+
+# load test for the review store: many threads, like many Streamlit sessions, saving reviews at the same time
+def bench_reviews(writers, reviews_per_writer, directory):
+    path = os.path.join(directory, "bench_reviews.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = ReviewStore(path)
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(number):
+        own = []
+        for review in range(reviews_per_writer):
+            start = time.perf_counter()
+            # every writer saves the same comment many times, so the duplicate check is left out here and measured
+            # on its own by the dedup benchmark
+            store.add_review(str(10000 + review % 50), f"Writer {number}", review % 5 + 1, "Nice puzzle",
+                             check_duplicates=False)
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = writers * reviews_per_writer
+    assert store.count() == total, "some reviews were lost"
+    print(f"{writers} writers saved {total} reviews in {elapsed * 1000:.0f} ms ({total / elapsed:.0f} reviews/s)")
+    print(f"save latency p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+          f"p99 {percentile(latencies, 0.99):.1f} ms")
+
+    start = time.perf_counter()
+    store.read_reviews(offset=total // 2, limit=20, item_number="10007")
+    print(f"reading a page of one item: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    # the summaries were updated with every batch and must match the reviews
+    start = time.perf_counter()
+    assert not store.check_summaries(), "the summaries do not match the reviews"
+    check = (time.perf_counter() - start) * 1000
+    top = best_time(lambda: store.top_rated(limit=10), 5)
+    start = time.perf_counter()
+    store.rebuild_summaries()
+    print(f"top rated from the summaries: {top:.2f} ms, checking the summaries: {check:.0f} ms, "
+          f"rebuilding them: {(time.perf_counter() - start) * 1000:.0f} ms")
+    store.close()
+
+    count = min(total, 2000)
+    print(f"for comparison, pd.concat of {count} reviews one by one: {bench_concat(count):.0f} ms")
+
+
+# duplicate check of new reviews while one item collects more and more reviews: the MinHash buckets compared with
+# a fuzzy scan over every earlier comment of the item
+def bench_dedup(sizes, repeat):
+    rng = random.Random(7)
+    checks = 200
+    # real comments use many more words than the puzzle names, so the comments are made from random words
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(2000)]
+    print(f"{'reviews':>8} {'add us':>7} {'bucket ms':>10} {'scan ms':>9} {'comparisons':>12} {'found':>6}")
+    for size in sizes:
+        comments = [" ".join(rng.choices(vocabulary, k=rng.randint(6, 20))) for _ in range(size)]
+        detector = DuplicateDetector(recent_per_item=size, max_reviews=size)
+        start = time.perf_counter()
+        detector.add_many(["10000"] * size, [f"Person {number}" for number in range(size)], comments)
+        add_us = (time.perf_counter() - start) * 1e6 / size
+        normalized = [normalize(comment) for comment in comments]
+
+        # half of the new reviews are an earlier review again with a small change, the other half are new
+        new = []
+        for number in range(checks):
+            if number % 2:
+                new.append(" ".join(rng.choices(vocabulary, k=rng.randint(6, 20))))
+            else:
+                new.append(rng.choice(comments) + " !")
+        detector.checks = detector.comparisons = 0
+        found = 0
+        start = time.perf_counter()
+        for number, comment in enumerate(new):
+            # check without remembering, so every round compares with the same reviews
+            text = normalize(comment)
+            found += detector._find("10000", f"New {number}", text, buckets(text)) is not None
+        bucket_ms = (time.perf_counter() - start) * 1000 / checks
+        comparisons = detector.report()["comparisons_per_check"]
+
+        scan_checks = max(checks // 20, 1)
+        scan_ms = best_time(lambda: [fuzzy_matching.extract_one(normalize(comment), normalized, cutoff=DUPLICATE_CUTOFF)
+                                     for comment in new[:scan_checks]], repeat) / scan_checks
+        print(f"{size:>8} {add_us:>7.1f} {bucket_ms:>10.3f} {scan_ms:>9.3f} {comparisons:>12.1f} {found:>6}")
+
+
+# peak memory of this process so far in megabytes, on Linux from /proc because ru_maxrss of a new process starts at
+# the peak of the process that started it, elsewhere ru_maxrss, which is in bytes on macOS
+def peak_rss():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+# one phase of the import benchmark: import (with or without the duplicate check) or export all reviews of the
+# database, or read the whole file with pandas for comparison, returns the result, the seconds it took, how much
+# opening the store raised the peak memory (mostly the recent reviews loaded by the duplicate check) and how much
+# the phase itself raised it afterwards
+def transfer_phase(kind, database, path, chunk_size):
+    before = peak_rss()
+    store = None if kind == "read_csv" else ReviewStore(database)
+    opened = peak_rss()
+    start = time.perf_counter()
+    if kind in ("import", "unchecked import"):
+        result = store.import_reviews(path, chunk_size=chunk_size, check_duplicates=kind == "import")
+    elif kind == "export":
+        result = store.export_reviews(path, chunk_size=chunk_size)
+    else:
+        result = len(pd.read_csv(path, dtype=str, keep_default_na=False))
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+    if store is not None:
+        store.close()
+    return result, elapsed, opened - before, peak - opened
+
+
+# run a function in a new process and return its result, the peak memory of a process only ever grows, so every
+# phase gets its own process to measure its own peak
+def in_new_process(function, *args):
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(function, *args).result()
+
+
+# bulk import and export of a big review file: throughput and the peak memory of every phase
+def bench_import(rows, directory, chunk_size):
+    folder = tempfile.mkdtemp(dir=directory)
+    source = os.path.join(folder, "reviews.csv")
+    rng = random.Random(5)
+
+    # the file is written in chunks as well, so creating it does not raise the peak memory
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        chunk = pd.DataFrame({
+            "Item Number": [str(10000 + rng.randrange(5000)) for _ in range(count)],
+            "Name": [f"Reviewer {rng.randrange(20000)}" for _ in range(count)],
+            "Stars": [rng.randint(1, 5) if rng.random() > 0.001 else 7 for _ in range(count)],
+            "Comment": [rng.choice(["Great puzzle", "Too hard", "Lovely colours, would buy again", "Okay"])
+                        for _ in range(count)],
+        })
+        chunk.to_csv(source, mode="a", header=start == 0, index=False)
+    print(f"{rows} reviews, {os.path.getsize(source) / 2**20:.0f} MB CSV, chunks of {chunk_size}")
+
+    # the duplicate check keeps up to review_dedup.MAX_REVIEWS reviews in memory, the import without it shows what
+    # reading the file in chunks needs
+    database = os.path.join(folder, "reviews.db")
+    for kind, path in {"unchecked import": os.path.join(folder, "unchecked.db"), "import": database}.items():
+        report, elapsed, opened, grown = in_new_process(transfer_phase, kind, path, source, chunk_size)
+        print(f"{kind}: {report['imported']} imported, {report['rejected']} rejected, {report['flagged']} flagged "
+              f"in {elapsed:.1f} s ({report['rows'] / elapsed:.0f} rows/s), peak memory +{grown:.0f} MB")
+    store = ReviewStore(database)
+    assert not store.check_summaries(), "the summaries do not match the reviews"
+    store.close()
+
+    for extension in ("csv", "parquet"):
+        target = os.path.join(folder, f"export.{extension}")
+        count, elapsed, opened, grown = in_new_process(transfer_phase, "export", database, target, chunk_size)
+        print(f"{extension} export: {count} reviews in {elapsed:.1f} s ({count / elapsed:.0f} rows/s), "
+              f"{os.path.getsize(target) / 2**20:.0f} MB, peak memory +{grown:.0f} MB "
+              f"(+{opened:.0f} MB for opening the store)")
+
+    # for comparison, the same file read into one DataFrame
+    _, elapsed, _, grown = in_new_process(transfer_phase, "read_csv", None, source, chunk_size)
+    print(f"pd.read_csv of the whole file: {elapsed:.1f} s, peak memory +{grown:.0f} MB")
+    shutil.rmtree(folder)
+
+
+# time to decode a list of images, which is what every visitor's browser does for every photo on the page
+def decode_time(paths):
+    start = time.perf_counter()
+    for path in paths:
+        with Image.open(path) as image:
+            image.load()
+    return (time.perf_counter() - start) * 1000
+
+
+# bytes and decode time of the journey photos before and after the image pipeline
+def bench_images(folder, directory):
+    photos = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+              if name.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+    # build the variants in an empty cache to see how long the first visit takes
+    image_cache.CACHE_DIR = tempfile.mkdtemp(dir=directory)
+    start = time.perf_counter()
+    image_cache.prepare_images(photos)
+    print(f"creating all variants of {len(photos)} photos: {(time.perf_counter() - start) * 1000:.0f} ms (once)")
+
+    original = sum(os.path.getsize(path) for path in photos)
+    print(f"{'variant':>10} {'MB':>8} {'saved':>7} {'decode ms':>10}")
+    print(f"{'original':>10} {original / 2**20:>8.2f} {'':>7} {decode_time(photos):>10.0f}")
+    for width in image_cache.VARIANT_WIDTHS:
+        variants = [image_cache.resized_image(path, width) for path in photos]
+        size = sum(os.path.getsize(path) for path in variants)
+        print(f"{width:>7} px {size / 2**20:>8.2f} {1 - size / original:>7.1%} {decode_time(variants):>10.0f}")
+    shutil.rmtree(image_cache.CACHE_DIR)
+
+
+# local stand-in for the image websites, answers every request with a small image after a delay
+class SlowImageHandler(http.server.BaseHTTPRequestHandler):
+    delay = 0.1
+    image = b""
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(self.image)))
+        self.end_headers()
+        self.wfile.write(self.image)
+
+    def log_message(self, *args):
+        pass
+
+
+# time to get every image of a list from the remote image cache, in milliseconds
+def fetch_time(cache, urls):
+    start = time.perf_counter()
+    for url in urls:
+        cache.get(url)
+    return (time.perf_counter() - start) * 1000
+
+
+# the remote image cache against a slow local web server: first visit, later visits and without the server
+def bench_remote(count, directory):
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), "steelblue").save(buffer, "JPEG")
+    SlowImageHandler.image = buffer.getvalue()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/puzzle_{number}.jpg" for number in range(count)]
+
+    folder = tempfile.mkdtemp(dir=directory)
+    cache = image_cache.RemoteImageCache(folder)
+    print(f"{count} images, {SlowImageHandler.delay * 1000:.0f} ms per download")
+    # the first visit shows the links and only starts the downloads
+    print(f"first visit (links):     {fetch_time(cache, urls):>8.1f} ms")
+    start = time.perf_counter()
+    cache.wait_for_downloads()
+    print(f"background downloads:    {(time.perf_counter() - start) * 1000:>8.1f} ms, "
+          f"{image_cache.DOWNLOAD_WORKERS} at a time")
+    print(f"next visit (cached):     {fetch_time(cache, urls):>8.1f} ms")
+    start = time.perf_counter()
+    for url in urls:
+        cache.resized(url, cache.get(url), 360)
+    print(f"resized variants:        {(time.perf_counter() - start) * 1000:>8.1f} ms")
+    print(f"online stats:  {cache.report()}")
+
+    # without the server, a new process with offline mode only uses the copies on disk
+    server.shutdown()
+    server.server_close()
+    offline = image_cache.RemoteImageCache(folder, offline=True)
+    print(f"offline visit:           {fetch_time(offline, urls):>8.1f} ms")
+    print(f"offline stats: {offline.report()}")
+
+    # a cache that only fits half of the images keeps the most recently used ones
+    # the variants count towards the limit and are deleted with their image
+    small = image_cache.RemoteImageCache(folder, limit=cache._size // 2)
+    small._evict()
+    files = len(os.listdir(folder))
+    print(f"with a limit of half the images, {len(small._files)} of {count} are kept, "
+          f"{files} files and {small._size / 2**20:.2f} MB on disk")
+    assert files == sum(len(names) for names, _ in small._files.values()), "some files are not counted"
+    shutil.rmtree(folder)
+
+
+# the pages in the sidebar of the portal
+PAGES = ["Welcome To PuzzlePortal", "Find Your Puzzle!", "Reviews", "Get Inspired!", "My Puzzle Journey"]
+
+
+# rerun time of every page of the portal, measured headless with Streamlit's AppTest
+def bench_reruns(script, runs, directory):
+    from streamlit.testing.v1 import AppTest
+
+    # no downloads and a throwaway review database
+    image_cache.remote_images.offline = True
+    review_store.REVIEWS_PATH = os.path.join(tempfile.mkdtemp(dir=directory), "reviews.db")
+
+    app = AppTest.from_file(os.path.abspath(script), default_timeout=120).run()
+    print(f"{'page':>24} {'first ms':>9} {'p50 ms':>8} {'mean ms':>8}")
+    for page in PAGES:
+        app.sidebar.selectbox[0].select(page)
+        start = time.perf_counter()
+        app.run()
+        first = (time.perf_counter() - start) * 1000
+
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            app.run()
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{page:>24} {first:>9.1f} {percentile(times, 0.5):>8.1f} {sum(times) / len(times):>8.1f}")
+
+
+# the first widget of a list with the given label, e.g. the "Item Number" field of the review form
+def widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+# one simulated visitor of the load test: navigates through all pages, fills in the questionnaire and saves a
+# review in every round, and returns the time of every rerun
+def simulate_session(number, script, rounds, item_numbers, barrier):
+    from streamlit.testing.v1 import AppTest
+
+    # the photos of the portal are found relative to its folder, just like with streamlit run
+    os.chdir(os.path.dirname(script))
+    rng = random.Random(number)
+    timings = []
+    app = AppTest.from_file(script, default_timeout=120).run()
+
+    def rerun(action):
+        start = time.perf_counter()
+        app.run()
+        timings.append((action, (time.perf_counter() - start) * 1000))
+        if app.exception:
+            raise RuntimeError(f"{action}: {app.exception[0].message}")
+
+    # all sessions start together once their app is loaded
+    barrier.wait(timeout=300)
+    start = time.perf_counter()
+    for round_number in range(rounds):
+        for page in PAGES:
+            app.sidebar.selectbox[0].select(page)
+            rerun(f"page:{page}")
+
+            if page == "Find Your Puzzle!":
+                for radio in app.radio:
+                    radio.set_value(rng.choice(radio.options))
+                widget(app.button, "Find My Puzzle!").click()
+                rerun("find_puzzle")
+            elif page == "Reviews":
+                # the item number is picked from a list unless the catalog is very big
+                if any(element.label == "Item Number" for element in app.selectbox):
+                    widget(app.selectbox, "Item Number").select(rng.choice(item_numbers))
+                else:
+                    widget(app.text_input, "Item Number").input(rng.choice(item_numbers))
+                widget(app.text_input, "Name").input(f"Load test {number}")
+                widget(app.slider, "Stars").set_value(rng.randint(1, 5))
+                # a different comment every round, the same comment twice would be rejected as a duplicate
+                widget(app.text_area, "Comment").input(f"Saved by the load test in round {round_number}, "
+                                                       f"{rng.getrandbits(64):016x}")
+                widget(app.button, "Save").click()
+                rerun("save_review")
+    return timings, time.perf_counter() - start
+
+
+# process of one load test session, AppTest keeps its runtime in a global so every session needs its own process
+def load_session(number, script, rounds, item_numbers, barrier, results):
+    try:
+        timings, elapsed = simulate_session(number, script, rounds, item_numbers, barrier)
+    except Exception as error:
+        # let the other sessions go on and tell the main process what went wrong
+        barrier.abort()
+        results.put((number, None, 0, f"{type(error).__name__}: {error}"))
+        return
+    results.put((number, timings, elapsed, peak_rss()))
+
+
+# the short hash of the checked out commit, so results of different commits can be told apart
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# count, throughput and latency percentiles of a list of rerun times in milliseconds
+def latency_summary(times, elapsed):
+    return {
+        "reruns": len(times),
+        "per_second": len(times) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(times, 0.5),
+        "p95_ms": percentile(times, 0.95),
+        "p99_ms": percentile(times, 0.99),
+        "max_ms": max(times),
+    }
+
+
+# load test of the whole portal: sessions visitors at the same time, each clicking through every page rounds times,
+# with the results saved as JSON so they can be compared with an earlier commit
+def bench_load(script, sessions, rounds, directory, output=None, compare=None):
+    # the sessions run offline with a throwaway review database, the environment is inherited by every process
+    folder = tempfile.mkdtemp(dir=directory)
+    os.environ["PUZZLE_PORTAL_OFFLINE"] = "1"
+    os.environ["PUZZLE_PORTAL_REVIEWS"] = os.path.join(folder, "reviews.db")
+    item_numbers = [number for number in read_catalog().frame["item_number"] if number]
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(sessions)
+    results = context.Queue()
+    processes = [context.Process(target=load_session, args=(number, os.path.abspath(script), rounds, item_numbers,
+                                                            barrier, results)) for number in range(sessions)]
+    for process in processes:
+        process.start()
+    finished = [results.get(timeout=600) for _ in processes]
+    for process in processes:
+        process.join()
+    shutil.rmtree(folder)
+    errors = [f"session {number}: {peak}" for number, timings, _, peak in finished if timings is None]
+    if errors:
+        raise RuntimeError("the load test failed\n" + "\n".join(errors))
+
+    # the sessions ran at the same time, so the slowest one is the duration of the whole test
+    elapsed = max(seconds for _, _, seconds, _ in finished)
+    timings = [timing for _, session, _, _ in finished for timing in session]
+    actions = {}
+    for action, milliseconds in timings:
+        actions.setdefault(action, []).append(milliseconds)
+
+    report = {
+        "commit": current_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sessions": sessions,
+        "rounds": rounds,
+        "seconds": elapsed,
+        "peak_rss_mb": max(peak for _, _, _, peak in finished),
+        "overall": latency_summary([milliseconds for _, milliseconds in timings], elapsed),
+        "actions": {action: latency_summary(times, elapsed) for action, times in sorted(actions.items())},
+    }
+
+    previous = None
+    if compare:
+        with open(compare) as file:
+            previous = json.load(file)
+    print(f"{sessions} sessions, {rounds} rounds, {report['overall']['reruns']} reruns in {elapsed:.1f} s "
+          f"({report['overall']['per_second']:.1f} reruns/s), peak RSS per session {report['peak_rss_mb']:.0f} MB")
+    header = f"{'action':>34} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print(header + (f" {'p95 before':>11}" if previous else ""))
+    for action, summary in [("overall", report["overall"])] + list(report["actions"].items()):
+        line = (f"{action:>34} {summary['reruns']:>6} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} "
+                f"{summary['p99_ms']:>8.1f}")
+        if previous:
+            before = previous["overall"] if action == "overall" else previous["actions"].get(action)
+            line += f" {before['p95_ms']:>11.1f}" if before else f" {'-':>11}"
+        print(line)
+
+    output = output or f"load-{report['commit']}.json"
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results saved to {output}")
+    return report
+
+
+# runs in a fresh Python process for the startup report: imports Streamlit, renders the first page (the welcome
+# page) and reruns it once, then prints the times and whether the fuzzy matching library was loaded as JSON
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+rendered = time.perf_counter()
+app.run()
+print(json.dumps({"streamlit_import_ms": (imported - start) * 1000, "first_render_ms": (rendered - imported) * 1000,
+                  "rerun_ms": (time.perf_counter() - rendered) * 1000, "exception": bool(app.exception),
+                  "fuzzy_loaded": "rapidfuzz" in sys.modules, "modules_loaded": len(sys.modules)}))
+"""
+
+# number of slowest imports listed in the startup report, the portal's own modules are always listed
+STARTUP_MODULES = 15
+
+
+# import time of every top-level module in milliseconds from the output of python -X importtime, the time of a
+# package includes everything it imports itself
+def import_times(output):
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented, only the imports of the app and the probe itself are counted
+        if len(name) - len(name.lstrip()) == 1:
+            module = name.strip().split(".")[0]
+            times[module] = times.get(module, 0.0) + int(cumulative) / 1000
+    return times
+
+
+# cold start of the portal: every run starts a new Python process that imports Streamlit and renders the welcome
+# page, which gives the import time of every module and the time until the first page is shown
+# the results are saved as JSON like the load test, so a startup regression shows up when compared with an earlier
+# commit
+def bench_startup(script, runs, directory, output=None, compare=None):
+    folder = tempfile.mkdtemp(dir=directory)
+    environment = dict(os.environ, PUZZLE_PORTAL_OFFLINE="1", PUZZLE_PORTAL_REVIEWS=os.path.join(folder, "reviews.db"))
+    script = os.path.abspath(script)
+    measured = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_PROBE, script], capture_output=True,
+                                text=True, env=environment, cwd=os.path.dirname(script))
+        total = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            shutil.rmtree(folder)
+            raise RuntimeError("the startup probe failed\n" + result.stderr[-2000:])
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        if probe["exception"]:
+            shutil.rmtree(folder)
+            raise RuntimeError("the welcome page raised an exception")
+        measured.append((total, probe, import_times(result.stderr)))
+    shutil.rmtree(folder)
+
+    # the fastest run of every number, like best_time, because the slower runs only add noise of the machine
+    own = {os.path.splitext(name)[0] for name in os.listdir(os.path.dirname(script)) if name.endswith(".py")}
+    modules = {}
+    for _, _, times in measured:
+        for module, milliseconds in times.items():
+            modules[module] = min(modules.get(module, milliseconds), milliseconds)
+    slowest = sorted(modules, key=lambda module: -modules[module])
+    shown = slowest[:STARTUP_MODULES] + [module for module in slowest[STARTUP_MODULES:] if module in own]
+    report = {
+        "commit": current_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "runs": runs,
+        "cold_start_ms": min(total for total, _, _ in measured),
+        "streamlit_import_ms": min(probe["streamlit_import_ms"] for _, probe, _ in measured),
+        "first_render_ms": min(probe["first_render_ms"] for _, probe, _ in measured),
+        "rerun_ms": min(probe["rerun_ms"] for _, probe, _ in measured),
+        "fuzzy_loaded": any(probe["fuzzy_loaded"] for _, probe, _ in measured),
+        "modules_loaded": measured[0][1]["modules_loaded"],
+        "imports_ms": {module: modules[module] for module in shown},
+    }
+
+    previous = None
+    if compare:
+        with open(compare) as file:
+            previous = json.load(file)
+    print(f"{runs} cold starts of {os.path.basename(script)}, {report['modules_loaded']} modules loaded, "
+          f"fuzzy matching library loaded on the welcome page: {'yes' if report['fuzzy_loaded'] else 'no'}")
+    header = f"{'':>34} {'ms':>8}"
+    print(header + (f" {'before':>8}" if previous else ""))
+    rows = [(name, report[key], previous.get(key) if previous else None) for name, key in
+            [("process start to rerun done", "cold_start_ms"),
+             ("import streamlit.testing (AppTest)", "streamlit_import_ms"),
+             ("first render of the welcome page", "first_render_ms"), ("rerun of the welcome page", "rerun_ms")]]
+    rows += [(f"import {module}" + (" (portal)" if module in own else ""), milliseconds,
+              previous["imports_ms"].get(module) if previous else None)
+             for module, milliseconds in report["imports_ms"].items()]
+    for name, milliseconds, before in rows:
+        line = f"{name:>34} {milliseconds:>8.1f}"
+        if previous:
+            line += f" {before:>8.1f}" if before is not None else f" {'-':>8}"
+        print(line)
+
+    output = output or f"startup-{report['commit']}.json"
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results saved to {output}")
+    return report
+
+
+BENCHMARKS = {
+    "matching": lambda args: bench_matching(args.sizes, args.repeat),
+    "ranking": lambda args: bench_ranking(args.sizes, args.k, args.repeat),
+    "recommendations": lambda args: bench_recommendations(args.sizes, args.k, args.repeat),
+    "catalog": lambda args: bench_catalog(args.sizes, args.directory),
+    "search": lambda args: bench_search(args.sizes, args.repeat),
+    "join": lambda args: bench_join(max(args.sizes), args.join_reviews, args.repeat),
+    "collaborative": lambda args: bench_collaborative(max(args.sizes), args.collaborative_reviews, args.repeat),
+    "images": lambda args: bench_images(args.images, args.directory),
+    "remote": lambda args: bench_remote(args.remote_images, args.directory),
+    "reruns": lambda args: bench_reruns(args.script, args.runs, args.directory),
+    "reviews": lambda args: bench_reviews(args.writers, args.reviews_per_writer, args.directory),
+    "dedup": lambda args: bench_dedup(args.dedup_sizes, args.repeat),
+    "import": lambda args: bench_import(args.import_rows, args.directory, args.chunk_size),
+    "startup": lambda args: bench_startup(args.script, args.cold_starts, args.directory, args.output,
+                                          args.compare),
+    "load": lambda args: bench_load(args.script, args.sessions, args.rounds, args.directory, args.output,
+                                    args.compare),
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks for PuzzlePortal")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"], nargs="?", default="all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--k", type=int, default=10, help="number of recommendations to rank")
+    parser.add_argument("--writers", type=int, default=200, help="concurrent review writers")
+    parser.add_argument("--reviews-per-writer", type=int, default=25)
+    parser.add_argument("--join-reviews", type=int, default=100_000, help="reviews joined to the catalog")
+    parser.add_argument("--collaborative-reviews", type=int, nargs="+", default=[100_000, 1_000_000],
+                        help="reviews the item similarities are built from")
+    parser.add_argument("--dedup-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="reviews of one item for the duplicate check")
+    parser.add_argument("--import-rows", type=int, default=1_000_000, help="reviews in the file to import")
+    parser.add_argument("--chunk-size", type=int, default=review_store.CHUNK_SIZE, help="reviews per chunk")
+    parser.add_argument("--images", default="images", help="folder with the journey photos")
+    parser.add_argument("--remote-images", type=int, default=30, help="images served by the local web server")
+    parser.add_argument("--script", default="puzzle_portal.py", help="the Streamlit app for the rerun benchmark")
+    parser.add_argument("--runs", type=int, default=20, help="reruns per page")
+    parser.add_argument("--cold-starts", type=int, default=3, help="new processes of the startup benchmark")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions of the load test")
+    parser.add_argument("--rounds", type=int, default=3, help="times every session clicks through all pages")
+    parser.add_argument("--output", help="JSON file for the load test or startup results, load-<commit>.json or "
+                                          "startup-<commit>.json by default")
+    parser.add_argument("--compare", help="JSON file of an earlier load test or startup report to compare with")
+    parser.add_argument("--directory", default=tempfile.gettempdir(), help="where to write temporary files")
+    args = parser.parse_args()
+
+    for name, benchmark in BENCHMARKS.items():
+        if args.benchmark in (name, "all"):
+            print(f"== {name} ==")
+            benchmark(args)
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+# all fuzzy matching of the portal (the answers on the preference page, the search box and the duplicate check of
+# reviews) goes through this module, so there is only one library to install, and it is only imported the first
+# time two texts are compared, pages without fuzzy matching never load it
+# PUZZLE_PORTAL_FUZZY picks the backend, other libraries can be added with register_backend
+BACKEND = os.environ.get("PUZZLE_PORTAL_FUZZY", "rapidfuzz")
+
+
+# backend on rapidfuzz, every score is the similarity of two texts from 0 to 100 (fuzz.ratio)
+class RapidfuzzBackend:
+    def __init__(self):
+        from rapidfuzz import fuzz, process
+        self.fuzz = fuzz
+        self.process = process
+
+    def ratio(self, first, second):
+        return self.fuzz.ratio(first, second)
+
+    def extract(self, query, choices, cutoff=0, limit=None):
+        return self.process.extract(query, choices, scorer=self.fuzz.ratio, score_cutoff=cutoff, limit=limit)
+
+    def extract_one(self, query, choices, cutoff=0):
+        return self.process.extractOne(query, choices, scorer=self.fuzz.ratio, score_cutoff=cutoff)
+
+    def cdist(self, queries, choices):
+        return self.process.cdist(queries, choices, scorer=self.fuzz.ratio, dtype=np.float64)
+
+
+# name -> function that creates the backend, it is only called when the backend is used
+_BACKENDS = {"rapidfuzz": RapidfuzzBackend}
+_backend = None
+
+
+# add another backend, it needs ratio, extract, extract_one and cdist with the same results as RapidfuzzBackend
+def register_backend(name, factory):
+    _BACKENDS[name] = factory
+
+
+# switch to another backend, e.g. to compare two libraries in the benchmark
+def use_backend(name):
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError(f"unknown fuzzy matching backend {name!r}, known are {', '.join(sorted(_BACKENDS))}")
+    _backend = _BACKENDS[name]()
+    return _backend
+
+
+# the backend in use, it is created (and its library imported) on the first call
+def backend():
+    return _backend or use_backend(BACKEND)
+
+
+# True once a backend was created, e.g. to check that a page did not need one
+def loaded():
+    return _backend is not None
+
+
+# similarity of two texts from 0 to 100
+def ratio(first, second):
+    return backend().ratio(first, second)
+
+
+# all choices at least cutoff similar to the query as (choice, score, key) tuples, best first, choices can be a list
+# (the key is the index) or a dict (the key is the dict key)
+def extract(query, choices, cutoff=0, limit=None):
+    return backend().extract(query, choices, cutoff, limit)
+
+
+# the best choice as (choice, score, key), or None if no choice is at least cutoff similar
+def extract_one(query, choices, cutoff=0):
+    return backend().extract_one(query, choices, cutoff)
+
+
+# similarity of every query to every choice as a float array of shape (queries, choices)
+def cdist(queries, choices):
+    return backend().cdist(queries, choices)
@@ -0,0 +1,61 @@
+import time
+
+import streamlit as st
+
+from image_cache import image_for
+from metrics import metrics
+
+
+# pop-up window with a photo in its original size
+@st.dialog("Original photo", width="large")
+def show_original(path):
+    st.image(path)
+
+
+# function for showing more images when "Load more" is clicked
+def _load_more(key, batch_size):
+    st.session_state[f"{key}_shown"] += batch_size
+
+
+# gallery of tiles with an image and an optional title and text, every item is a dict with "image" (a local path
+# or a link, both are shown as a cached and resized copy) and optionally "title" and "text"
+# the titles and texts of all visible tiles are shown first with a placeholder for every image, then the images
+# are loaded one after the other, and only batch_size tiles are shown until the user asks for more
+# returns the time in milliseconds it took to load each image, which is also kept in st.session_state
+def gallery(items, key, columns=2, batch_size=6, column_width=720, border=False, expandable=False):
+    if f"{key}_shown" not in st.session_state:
+        st.session_state[f"{key}_shown"] = batch_size
+    timings = st.session_state.setdefault(f"{key}_timings", {})
+    visible = items[:st.session_state[f"{key}_shown"]]
+
+    # draw all tiles with placeholders first, so the page shows up before any image is loaded
+    grid = st.columns(columns)
+    placeholders = []
+    for number, item in enumerate(visible):
+        tile = grid[number % columns].container(border=border)
+        if item.get("title"):
+            tile.title(item["title"])
+        placeholder = tile.empty()
+        placeholder.caption("🧩 Loading image...")
+        if item.get("text"):
+            tile.write(item["text"])
+        if expandable and tile.button("Show original", key=f"{key}_original_{number}"):
+            show_original(item["image"])
+        placeholders.append(placeholder)
+
+    # now load the images into their placeholders
+    for item, placeholder in zip(visible, placeholders):
+        start = time.perf_counter()
+        with metrics.timed("section", "gallery_image"):
+            placeholder.image(image_for(item["image"], column_width))
+        timings[item["image"]] = (time.perf_counter() - start) * 1000
+
+    if len(items) > len(visible):
+        st.button(f"Load more ({len(items) - len(visible)} left)", key=f"{key}_more", on_click=_load_more,
+                  args=(key, batch_size))
+    return timings
+
+
+# the load time of every image of a gallery in this session, in milliseconds
+def image_timings(key):
+    return st.session_state.get(f"{key}_timings", {})
@@ -0,0 +1,353 @@
+import base64
+import functools
+import hashlib
+import mimetypes
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_for
+
+from PIL import Image, ImageOps
+
+# folder for the resized images, can be moved with the PUZZLE_PORTAL_IMAGE_CACHE environment variable
+CACHE_DIR = os.environ.get("PUZZLE_PORTAL_IMAGE_CACHE",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache"))
+
+# widths of the resized variants of every photo, the smallest one that fits the column is shown
+VARIANT_WIDTHS = (360, 720, 1440)
+
+# the variants are saved as JPEG (or PNG if they are transparent), because st.image converts every other format to
+# JPEG again on every rerun
+VARIANT_QUALITY = 82
+
+# downloaded images from other websites are kept until they are older than REMOTE_TTL seconds, and the least
+# recently used ones are deleted when all of them together are bigger than REMOTE_LIMIT bytes
+REMOTE_DIR = os.path.join(CACHE_DIR, "remote")
+REMOTE_TTL = 7 * 24 * 60 * 60
+REMOTE_LIMIT = 200 * 2**20
+DOWNLOAD_TIMEOUT = 5
+# number of images that are downloaded at the same time in the background
+DOWNLOAD_WORKERS = 4
+
+# a link that could not be downloaded is only tried again after this many seconds, so a website that is down does
+# not slow down every page view
+RETRY_AFTER = 5 * 60
+
+# tables (st.column_config.ImageColumn with width="small") show pictures about 75 pixels wide, twice that is still
+# sharp on high resolution screens, and this many of them are kept in memory as data URLs
+THUMBNAIL_WIDTH = 150
+THUMBNAIL_CACHE = 1000
+
+# with PUZZLE_PORTAL_OFFLINE=1 nothing is downloaded and only images that are already cached are used
+OFFLINE = os.environ.get("PUZZLE_PORTAL_OFFLINE") == "1"
+
+# content hash of every file we have seen, so big photos are only read once per process
+_hashes = {}
+
+
+# hash of the content of a file, kept as long as the file does not change
+def content_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()[:16]
+    return _hashes[key]
+
+
+# the smallest variant width that is at least as wide as the column, or the largest variant
+def variant_width(column_width):
+    for width in VARIANT_WIDTHS:
+        if width >= column_width:
+            return width
+    return VARIANT_WIDTHS[-1]
+
+
+# path of a resized copy of a photo, it is created the first time it is needed
+def resized_image(path, width):
+    name = f"{content_hash(path)}_{width}"
+    for extension in (".jpg", ".png"):
+        if os.path.exists(os.path.join(CACHE_DIR, name + extension)):
+            return os.path.join(CACHE_DIR, name + extension)
+    return save_resized(path, width, CACHE_DIR, name)
+
+
+# write a copy of a photo that is at most width pixels wide to folder/name.jpg (or .png if it is transparent)
+def save_resized(path, width, folder, name):
+    os.makedirs(folder, exist_ok=True)
+    with Image.open(path) as image:
+        # let the JPEG decoder skip detail we throw away anyway, which makes decoding big photos much faster
+        image.draft("RGB", (width, width))
+        # phone photos are often stored sideways with the rotation only in the EXIF data
+        image = ImageOps.exif_transpose(image)
+        transparent = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if transparent else "RGB")
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+
+        # write to a temporary file first, so other sessions never see a half written image
+        target = os.path.join(folder, name + (".png" if transparent else ".jpg"))
+        handle, temporary = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            if transparent:
+                image.save(file, "PNG", optimize=True)
+            else:
+                image.save(file, "JPEG", quality=VARIANT_QUALITY, optimize=True, progressive=True)
+    os.replace(temporary, target)
+    return target
+
+
+# the variant of a photo that fits a column of the given width in pixels
+def fitting_image(path, column_width):
+    return resized_image(path, variant_width(column_width))
+
+
+# disk cache for images from other websites: every image is downloaded once and then served by our own server,
+# so slow or broken websites do not slow down the portal
+# a page never waits for a download: an image that is not cached yet is shown from its link (the browser loads it
+# like before) and downloaded in the background for the next visit
+# the resized variants of an image are stored next to it as <hash>_<width>.jpg, they count towards the limit and
+# are deleted together with the image
+class RemoteImageCache:
+    def __init__(self, directory=REMOTE_DIR, ttl=REMOTE_TTL, limit=REMOTE_LIMIT, offline=OFFLINE):
+        self.directory = directory
+        self.ttl = ttl
+        self.limit = limit
+        self.offline = offline
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._failed = {}
+        self._downloads = {}
+        self._pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="image-download")
+
+        # hash of the link -> (names of the image and its variants, size in bytes of all of them), ordered from
+        # least to most recently used
+        self._files = OrderedDict()
+        self._size = 0
+        if os.path.isdir(directory):
+            names = [name for name in os.listdir(directory) if not name.endswith(".tmp")]
+            names.sort(key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+            for name in names:
+                key = os.path.splitext(name)[0].split("_")[0]
+                files, size = self._files.pop(key, ([], 0))
+                self._files[key] = (files + [name], size + os.path.getsize(os.path.join(directory, name)))
+                self._size += os.path.getsize(os.path.join(directory, name))
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    # the local copy of an image, or the link itself if there is no copy yet, a missing or outdated copy is
+    # downloaded in the background unless wait is True
+    def get(self, url, wait=False):
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is not None:
+                self._files.move_to_end(key)
+        # the variants have a _ in their name, the downloaded image does not
+        original = next((name for name in entry[0] if "_" not in name), None) if entry else None
+        path = os.path.join(self.directory, original) if original else None
+
+        if path is not None and (self.offline or time.time() - os.path.getmtime(path) < self.ttl):
+            self._count("hits")
+            return path
+        self._count("misses")
+        if self.offline or time.time() - self._failed.get(key, 0) < RETRY_AFTER:
+            return path or url
+
+        if wait:
+            return self._fetch(url, key) or path or url
+        with self._lock:
+            if key not in self._downloads:
+                self._downloads[key] = self._pool.submit(self._fetch, url, key)
+        if path is not None:
+            # an old copy is better than no image at all until the new one is there
+            self._count("stale")
+            return path
+        return url
+
+    # download an image, returns its path or None if it could not be downloaded
+    def _fetch(self, url, key):
+        try:
+            return self._download(url, key)
+        except (OSError, ValueError):
+            with self._lock:
+                self._failed[key] = time.time()
+                self.stats["errors"] += 1
+            return None
+        finally:
+            with self._lock:
+                self._downloads.pop(key, None)
+
+    def _download(self, url, key):
+        request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0 PuzzlePortal"})
+        with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+            content_type = response.headers.get_content_type()
+            data = response.read()
+        extension = mimetypes.guess_extension(content_type) or os.path.splitext(url.split("?")[0])[1] or ".img"
+        name = key + extension
+
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temporary, os.path.join(self.directory, name))
+
+        with self._lock:
+            # the variants of the old copy show the old image, so they are deleted with it
+            old = self._files.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+                for old_name in old[0]:
+                    if old_name != name:
+                        self._remove(old_name)
+            self._files[key] = ([name], len(data))
+            self._size += len(data)
+            self._evict()
+        return os.path.join(self.directory, name)
+
+    # the variant of a cached image (path, from get) that is width pixels wide, it is created the first time and
+    # counts towards the limit of the cache
+    def resized(self, url, path, width):
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        name = f"{key}_{width}"
+        with self._lock:
+            entry = self._files.get(key)
+            for existing in (entry[0] if entry else ()):
+                if os.path.splitext(existing)[0] == name:
+                    return os.path.join(self.directory, existing)
+
+        target = save_resized(path, width, self.directory, name)
+        size = os.path.getsize(target)
+        with self._lock:
+            entry = self._files.pop(key, None)
+            if entry is None:
+                # the image was deleted while the variant was made, so the variant goes as well
+                self._remove(os.path.basename(target))
+                return url
+            files, total = entry
+            if os.path.basename(target) not in files:
+                files, total = files + [os.path.basename(target)], total + size
+                self._size += size
+            self._files[key] = (files, total)
+            self._evict()
+        return target
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    # delete the least recently used images with their variants until the cache is small enough again, keeps the
+    # newest one
+    def _evict(self):
+        while self._size > self.limit and len(self._files) > 1:
+            _, (names, size) = self._files.popitem(last=False)
+            self._size -= size
+            for name in names:
+                self._remove(name)
+
+    # wait until the downloads that were started in the background are done, e.g. in the benchmark
+    def wait_for_downloads(self, timeout=None):
+        with self._lock:
+            downloads = list(self._downloads.values())
+        wait_for(downloads, timeout=timeout)
+
+    # hits, misses and the hit rate since the start of the process
+    def report(self):
+        requests = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, files=len(self._files), megabytes=self._size / 2**20, downloading=len(self._downloads),
+                    hit_rate=self.stats["hits"] / requests if requests else 0.0)
+
+    # download a list of images ahead of time, e.g. before the portal has to run without internet
+    def seed(self, urls):
+        for url in urls:
+            self.get(url, wait=True)
+        return self.report()
+
+
+remote_images = RemoteImageCache()
+
+
+# the image to show for a local photo or a link: links are replaced by a resized variant of the cached copy, and
+# photos are replaced by a resized variant that fits a column of the given width
+def image_for(source, column_width):
+    try:
+        if source.startswith(("http://", "https://")):
+            path = remote_images.get(source)
+            if path == source:
+                return source
+            return remote_images.resized(source, path, variant_width(column_width))
+        return fitting_image(source, column_width)
+    except OSError:
+        # not an image Pillow can read, e.g. an SVG, so show the link or file as it is
+        return source
+
+
+# a small picture of a link or photo for a table cell: st.column_config.ImageColumn only shows links and data URLs,
+# so the resized copy from the cache is sent with the table as a data URL instead of letting the browser fetch the
+# image from the other website on every visit, the link is only shown until the image is downloaded
+def thumbnail_for(source):
+    if not isinstance(source, str) or not source:
+        return source
+    try:
+        if source.startswith(("http://", "https://")):
+            path = remote_images.get(source)
+            if path == source:
+                return source
+            path = remote_images.resized(source, path, THUMBNAIL_WIDTH)
+            # the image was deleted from the cache in the meantime
+            if path == source:
+                return source
+        else:
+            path = resized_image(source, THUMBNAIL_WIDTH)
+        return _data_url(path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return source
+
+
+# the content of an image file as a data URL, the modification time is part of the key so a new copy of the image
+# is read again
+@functools.lru_cache(maxsize=THUMBNAIL_CACHE)
+def _data_url(path, modified):
+    with open(path, "rb") as file:
+        data = base64.b64encode(file.read()).decode()
+    return f"data:{'image/png' if path.endswith('.png') else 'image/jpeg'};base64,{data}"
+
+
+# create all variants of some photos, e.g. while building the app, and return the size in bytes of the originals
+# and of the variants of every width
+def prepare_images(paths):
+    original = 0
+    resized = dict.fromkeys(VARIANT_WIDTHS, 0)
+    for path in paths:
+        original += os.path.getsize(path)
+        for width in VARIANT_WIDTHS:
+            resized[width] += os.path.getsize(resized_image(path, width))
+    return original, resized
+
+
+if __name__ == "__main__":
+    # python image_cache.py --seed downloads the images of the puzzle catalog and any links given after it
+    if sys.argv[1:2] == ["--seed"]:
+        import puzzle_catalog
+        links = list(puzzle_catalog.read_catalog().frame["image_url"]) + sys.argv[2:]
+        print(remote_images.seed(links))
+        sys.exit()
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "images"
+    photos = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+              if name.lower().endswith((".jpg", ".jpeg", ".png"))]
+    before, after = prepare_images(photos)
+    print(f"prepared {len(photos)} photos in {CACHE_DIR}, originals: {before / 2**20:.1f} MB")
+    for width, size in after.items():
+        print(f"{width:>5} px: {size / 2**20:.2f} MB")
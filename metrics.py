@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+# the metrics are only collected with PUZZLE_PORTAL_METRICS=1, otherwise every call returns right away
+ENABLED = os.environ.get("PUZZLE_PORTAL_METRICS") == "1"
+
+# the Prometheus text export is written to this file, at most every EXPORT_INTERVAL seconds
+METRICS_PATH = os.environ.get("PUZZLE_PORTAL_METRICS_FILE",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.prom"))
+EXPORT_INTERVAL = 10
+
+# sessions that did not rerun for this many seconds are left out of the session memory
+SESSION_TIMEOUT = 60 * 60
+
+# number of recent timings kept per page or section for the percentiles
+SAMPLES = 1000
+
+_DISABLED = nullcontext()
+
+
+# timer for one page or section, adds the time to the metrics when the with block ends
+class _Timer:
+    def __init__(self, metrics, kind, name):
+        self.metrics = metrics
+        self.key = (kind, name)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.key, time.perf_counter() - self.start)
+
+
+# size in bytes of a value in st.session_state, DataFrames and arrays are measured with their own functions
+def deep_size(value, seen=None):
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+# timings, counters and the memory of every session, shared by all sessions of the process
+class Metrics:
+    def __init__(self, enabled=ENABLED, path=METRICS_PATH):
+        self.enabled = enabled
+        self.path = path
+        self.timings = {}
+        self.counters = {}
+        self.sessions = {}
+        self._exported = 0
+        self._lock = threading.Lock()
+
+    # with metrics.timed("section", "review_save"): ... measures the time of the with block
+    def timed(self, kind, name):
+        if not self.enabled:
+            return _DISABLED
+        return _Timer(self, kind, name)
+
+    def observe(self, key, seconds):
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = {"count": 0, "sum": 0.0, "max": 0.0, "recent": deque(maxlen=SAMPLES)}
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["recent"].append(seconds)
+
+    def increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # size of every entry of a session's st.session_state
+    def record_session(self, session_id, state):
+        if not self.enabled:
+            return
+        sizes = {str(key): deep_size(value) for key, value in state.items()}
+        with self._lock:
+            self.sessions[session_id] = (time.time(), sizes)
+            for old in [old for old, (seen, _) in self.sessions.items() if time.time() - seen > SESSION_TIMEOUT]:
+                del self.sessions[old]
+
+    # count, total, mean, percentiles and maximum of every page and section, in milliseconds
+    def timing_table(self):
+        with self._lock:
+            rows = [(kind, name, timing["count"], timing["sum"], timing["max"], np.array(timing["recent"]))
+                    for (kind, name), timing in sorted(self.timings.items())]
+        return pd.DataFrame([{
+            "kind": kind,
+            "name": name,
+            "count": count,
+            "mean ms": total / count * 1000,
+            "p50 ms": np.percentile(recent, 50) * 1000,
+            "p95 ms": np.percentile(recent, 95) * 1000,
+            "max ms": longest * 1000,
+        } for kind, name, count, total, longest, recent in rows])
+
+    # the metrics in the Prometheus text format, extra is a dict of additional gauges
+    def export(self, extra=None):
+        lines = ["# TYPE puzzle_portal_seconds summary"]
+        with self._lock:
+            for (kind, name), timing in sorted(self.timings.items()):
+                labels = f'kind="{kind}",name="{_escape(name)}"'
+                recent = np.array(timing["recent"])
+                for quantile in (0.5, 0.95, 0.99):
+                    lines.append(f'puzzle_portal_seconds{{{labels},quantile="{quantile}"}} '
+                                 f'{np.quantile(recent, quantile):.6f}')
+                lines.append(f"puzzle_portal_seconds_sum{{{labels}}} {timing['sum']:.6f}")
+                lines.append(f"puzzle_portal_seconds_count{{{labels}}} {timing['count']}")
+
+            lines.append("# TYPE puzzle_portal_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'puzzle_portal_events_total{{name="{_escape(name)}"}} {value}')
+
+            totals = [sum(sizes.values()) for _, sizes in self.sessions.values()]
+            lines.append("# TYPE puzzle_portal_sessions gauge")
+            lines.append(f"puzzle_portal_sessions {len(totals)}")
+            lines.append("# TYPE puzzle_portal_session_state_bytes gauge")
+            lines.append(f'puzzle_portal_session_state_bytes{{stat="total"}} {sum(totals)}')
+            lines.append(f'puzzle_portal_session_state_bytes{{stat="max"}} {max(totals, default=0)}')
+
+        for name, value in sorted((extra or {}).items()):
+            lines.append(f"# TYPE puzzle_portal_{name} gauge")
+            lines.append(f"puzzle_portal_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    # write the export to the metrics file, but not more often than every EXPORT_INTERVAL seconds, extra can also be
+    # a function that returns the gauges, it is only called when the file is actually written
+    def write(self, extra=None, force=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            if not force and time.time() - self._exported < EXPORT_INTERVAL:
+                return
+            self._exported = time.time()
+        if callable(extra):
+            extra = extra()
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            file.write(self.export(extra))
+        os.replace(temporary, self.path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -0,0 +1,211 @@
+# static content of the portal: it lives in its own module so it is only built once when the app starts and not
+# again on every rerun of puzzle_portal.py
+
+# the colour themes that can be chosen in the sidebar
+THEMES = {
+    "Blue": {
+        "primary_color": "#80c9ff",  # light medium blue
+        "background_color": "#bfe4ff",  # bright blue
+        "text_color": "#0066b3",  # medium blue
+        "header_color": "#00487d"  # dark blue
+    },
+    "Purple": {
+        "primary_color": "#9267AA",  # medium purple
+        "background_color": "#9267AA",  # Dark purple
+        "text_color": "#D1CCFF",  # light medium purple
+        "header_color": "#E2CCFF"  # bright purple
+    },
+    "Brown": {
+        "primary_color": "#bf8860",  # medium brown
+        "background_color": "#806959",  # Dark brown
+        "text_color": "#cca88f",  # light medium brown
+        "header_color": "#e6d8cf"  # bright brown
+    },
+    "Green": {
+        "primary_color": "#00b069",  # medium green
+        "background_color": "#007b49",  # Dark green
+        "text_color": "#80ffcc",  # light medium green
+        "header_color": "#bfffe5"  # bright green
+    }
+}
+
+
+# function for building the custom css of a theme, here I had help from ChatGPT
+def theme_css(theme):
+    return f"""
+    <style>
+        :root {{
+            --primary-color: {theme['primary_color']};
+            --background-color: {theme['background_color']};
+            --text-color: {theme['text_color']};
+            --header-color: {theme['header_color']};
+        }}
+
+        /* Apply background color and text color with higher specificity */
+        html, body, div.stApp {{
+            background-color: var(--background-color) !important;
+            color: var(--text-color) !important;
+        }}
+
+        h1, h2, h3, h4, h5, h6 {{
+            color: var(--header-color) !important;
+        }}
+
+        /* Streamlit-specific class adjustments */
+        .css-18e3th9 {{
+            background-color: var(--background-color) !important;
+            color: var(--text-color) !important;
+        }}
+
+        .stButton > button {{
+            background-color: var(--primary-color) !important;
+            color: var(--text-color) !important;
+        }}
+
+        .stTextInput > div > div input {{
+            background-color: var(--background-color) !important;
+            color: var(--text-color) !important;
+        }}
+
+        .css-1cpxqw2 {{
+            background-color: var(--background-color) !important;
+        }}
+    </style>
+    """
+
+
+# the custom css of every theme, built once
+THEME_CSS = {name: theme_css(theme) for name, theme in THEMES.items()}
+
+# background colour of the sidebar
+SIDEBAR_CSS = """
+<style>
+    [data-testid=stSidebar] {
+        background-color: #596f80;
+    }
+</style>
+"""
+
+# list of pop-up messages
+MESSAGES = [
+    "Hey there! Just finished my puzzle—took me 15 minutes. What’s your time looking like?",
+    "Pro tip: Start with the corners; it’s a game changer!",
+    "How’s it going? I always find the edges first; works for me!",
+    "Wow, I just unlocked a 6x6 grid. Have you tried it yet?",
+    "Did you know the world’s largest jigsaw puzzle had over 500,000 pieces? Imagine that!",
+    "Almost there? I can’t wait to see the finished puzzle!",
+    "You’re doing amazing—keep it up! Don’t let that one tricky piece fool you.",
+    "Fun fact: Puzzles were invented in the 1760s. You're part of a historic tradition!",
+    "Think of it like life: one piece at a time, and it all fits together.",
+    "Need a break? Sometimes a fresh perspective makes all the difference!",
+    "I just unlocked a cat-themed puzzle—so adorable! What’s your favorite theme?",
+    "Have you tried rotating pieces? Sometimes the solution’s simpler than you think.",
+    "Challenge accepted! I’m trying to beat your time on the last puzzle.",
+    "Puzzles are like meditation for the brain. Feeling zen yet?",
+    "Wow, your puzzle looks great! Want to swap tips on tough spots?",
+    "I love how satisfying it is when the final piece clicks. Almost there?",
+    "You’re inspiring me! I might take on a harder level next.",
+    "Stuck? Look at the colors and patterns—it always helps me!",
+    "I just discovered there’s a world championship for puzzling. Should we enter?",
+    "Way to go, puzzler extraordinaire! I’m cheering you on from here!",
+]
+
+
+# the images of the welcome page, the first two in the first column and the others in the second column
+WELCOME_IMAGES = [
+    ("https://images.unsplash.com/photo-1621211255064-8915268b62f4?q=80&w=2340&auto=format&fit=crop"
+     "&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D"),
+    ("https://images.unsplash.com/photo-1688930495342-eac24a42d65a?q=80&w=2348&auto=format&fit=crop"
+     "&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D"),
+    "https://www.historytoday.com/sites/default/files/2021-03/Jigsaws.jpg",
+    "https://m.media-amazon.com/images/I/71egJKcfAiL.jpg",
+]
+
+
+
+# the hobbies on the inspiration page, each with a title, an image and a short description
+HOBBIES = [
+    {
+        "title": "Origami",
+        "image": "https://www.japanwelt.de/media/image/origami-figuren-tiere-falten.jpg",
+        "text": ("Origami is the Japanese art of paper folding, transforming a simple sheet into intricate designs "
+                 "like animals, flowers, and geometric shapes. It promotes creativity, patience, and fine motor "
+                 "skills."),
+    },
+    {
+        "title": "Knitting",
+        "image": "https://nimble-needles.com/wp-content/uploads/2021/09/how-to-knit-for-beginners-720x720.jpg",
+        "text": ("Knitting is a relaxing craft where yarn is looped together to create textiles, from scarves to "
+                 "sweaters. It’s a meditative activity that enhances focus and creativity while producing beautiful "
+                 "handmade items."),
+    },
+    {
+        "title": "Sudoku",
+        "image": "https://sudoku-puzzles.net/wp-content/puzzles/butterfly-sudoku/easy/1.png",
+        "text": ("Sudoku is a number puzzle that challenges logical thinking by requiring players to fill a grid so "
+                 "that each row, column, and section contain all digits exactly once. It’s a great mental workout that "
+                 "improves problem-solving skills."),
+    },
+    {
+        "title": "Cross- word",
+        "image": "https://www.treevalleyacademy.com/wp-content/uploads/6th-Grade-Fall-Crossword-791x1024.png.webp",
+        "text": ("Crossword puzzles test vocabulary and general knowledge by asking players to fit words into a grid "
+                 "using given clues. They help expand language skills and keep the mind sharp."),
+    },
+    {
+        "title": "Coding",
+        "image": "https://i.insider.com/60144316a7c0c4001991dde6?width=800&format=jpeg&auto=webp",
+        "text": ("Coding involves writing and structuring computer programs, similar to solving a puzzle with logic and "
+                 "creativity. It enhances problem-solving skills and is used in everything from web development to "
+                 "artificial intelligence."),
+    },
+    {
+        "title": "Wooden Puzzles",
+        "image": "https://magicholz.de/cdn/shop/files/LKB01-Classic-Gramophone-Robotime-ROKR-v10.png?v=1699300249&width=960",
+        "text": ("Wooden puzzles come in many forms, from interlocking pieces to handcrafted brain teasers. They offer "
+                 "a tactile and engaging challenge that improves spatial reasoning and patience."),
+    },
+    {
+        "title": "Metal Puzzles",
+        "image": "https://www.kastner-oehler.de/metal+earth-3d+metallbausatz+-+star+wars+-+sith+tie+fighter-1-768_1024_75-7429781_1.webp",
+        "text": ("Metal puzzles involve disentangling linked rings, wires, or shapes, requiring a mix of dexterity and "
+                 "logical thinking. They are fun and satisfying brain teasers that test patience and problem-solving "
+                 "skills."),
+    },
+    {
+        "title": "Lego",
+        "image": "https://lego.storeturkey.com.tr/millennium-falcon-v29-star-wars-lego-24646-33-B.jpg",
+        "text": ("Building with Lego allows for endless creativity, whether constructing detailed models or original "
+                 "designs. It enhances spatial awareness, engineering skills, and imagination in both children and "
+                 "adults."),
+    },
+    {
+        "title": "Painting",
+        "image": "https://images.seattletimes.com/wp-content/uploads/2019/07/ross1_0723.jpg?d=1020x680",
+        "text": ("Painting is a creative expression that allows artists to bring their imagination to life using colors "
+                 "and brushes. It can be a relaxing hobby that enhances focus, emotional expression, and artistic "
+                 "skills while producing unique and personal artworks."),
+    },
+]
+
+
+# the photos of the journey page, shown from left to right in two columns
+JOURNEY_PHOTOS = [
+    "images/IMG_2663.JPG",
+    "images/IMG_4876.JPG",
+    "images/23E5963A-E0CA-4FEC-82F9-CC2BB34937C3.JPG",
+    "images/IMG_2665.JPG",
+    "images/IMG_2661.JPG",
+    "images/IMG_2097.jpg",
+    "images/IMG_3093.JPG",
+    "images/IMG_2670.JPG",
+    "images/IMG_1187.jpg",
+    "images/IMG_4036.JPG",
+    "images/9B63ECCC-7F06-4E37-B174-61DCA2E733A9 2.jpg",
+    "images/IMG_2664.JPG",
+    "images/F089577B-648F-4F1D-A21C-6EFA02A326AA.jpg",
+    "images/7D140F56-97D3-4FE3-83BA-1C144F05C1D8 2.JPG",
+]
+
+# the journey photos as items for the gallery
+JOURNEY_GALLERY = [{"image": path} for path in JOURNEY_PHOTOS]
@@ -0,0 +1,108 @@
+import os
+import random
+import re
+
+import numpy as np
+import pandas as pd
+
+from puzzle_matching import ATTRIBUTES, PuzzleMatcher, RecommendationCache
+from puzzle_search import SearchIndex
+
+# the catalog file that is shipped with the portal
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "puzzles.csv")
+
+# the item number is the number at the end of the puzzle name, e.g. "Guanajuato in Mexiko 17442"
+ITEM_NUMBER = re.compile(r"(\d+)\s*$")
+
+
+# the puzzle catalog, stored column by column in a DataFrame instead of as one dict per puzzle,
+# together with the indexes and the matching engine that are built once when the file is loaded
+class PuzzleCatalog:
+    def __init__(self, frame):
+        frame = frame.reset_index(drop=True)
+        self.frame = pd.DataFrame({
+            "name": frame["name"].astype(str),
+            "image_url": frame["image_url"].astype(str),
+            "item_number": frame["name"].astype(str).str.extract(ITEM_NUMBER, expand=False).fillna(""),
+        })
+        # the attributes repeat a lot, so categories need far less memory than plain strings
+        for key in ATTRIBUTES:
+            self.frame[key] = frame[key].fillna("").astype(str).astype("category")
+
+        # index by item number: item number -> row, and the same as a pandas index to look up many at once
+        self.by_item_number = {number: row for row, number in enumerate(self.frame["item_number"]) if number}
+        # get_indexer returns -1 for unknown numbers, which picks the -1 at the end of the rows
+        self._item_index = pd.Index(list(self.by_item_number), dtype=object)
+        self._item_rows = np.append(np.fromiter(self.by_item_number.values(), dtype=np.intp), -1)
+        # names and image links with an empty string at the end for the -1 of unknown numbers as well
+        self._names = np.append(self.frame["name"].to_numpy(dtype=object), "")
+        self._images = np.append(self.frame["image_url"].to_numpy(dtype=object), "")
+
+        # index by attribute: column -> attribute value -> rows with that value
+        self.by_attribute = {key: {value: np.asarray(rows) for value, rows in
+                                   self.frame.groupby(key, observed=True).indices.items()}
+                             for key in ATTRIBUTES}
+
+        self.matcher = PuzzleMatcher([self.frame[key] for key in ATTRIBUTES])
+        self.recommendations = RecommendationCache(self.matcher)
+        self.search_index = SearchIndex(self)
+
+    # build a catalog from a list of puzzle dicts like the one that used to be in the preference page
+    @classmethod
+    def from_records(cls, puzzles):
+        rows = [dict(name=puzzle["name"], image_url=puzzle["image_url"], **dict(zip(ATTRIBUTES, puzzle["attributes"])))
+                for puzzle in puzzles]
+        return cls(pd.DataFrame(rows, columns=["name", "image_url"] + ATTRIBUTES))
+
+    def __len__(self):
+        return len(self.frame)
+
+    # a single puzzle as a dict with name, image url, item number and the list of attributes
+    def puzzle(self, row):
+        record = self.frame.iloc[row]
+        return {
+            "name": record["name"],
+            "image_url": record["image_url"],
+            "item_number": record["item_number"],
+            "attributes": [record[key] for key in ATTRIBUTES],
+        }
+
+    # row of the puzzle with this item number, or None if there is no such puzzle
+    def find(self, item_number):
+        return self.by_item_number.get(str(item_number).strip())
+
+    # rows of the puzzles with these item numbers in the same order, -1 for unknown numbers, all looked up at once
+    def rows_for(self, item_numbers):
+        numbers = pd.Index(item_numbers).astype(str).str.strip()
+        return self._item_rows[self._item_index.get_indexer(numbers)]
+
+    # name and image link of the puzzles with these item numbers as a DataFrame in the same order, e.g. to show
+    # next to reviews, empty for item numbers that are not in the catalog
+    def details(self, item_numbers):
+        rows = self.rows_for(item_numbers)
+        # object columns, converting them to pandas strings would take longer than the lookup itself
+        return pd.DataFrame({"Puzzle": self._names[rows], "Image": self._images[rows]}, dtype=object)
+
+    # rows and scores of the puzzles that fit a search query best, e.g. "leuchtturm" or an item number
+    def search(self, query, limit=10):
+        return self.search_index.search(query, limit)
+
+    # rows of all puzzles that have this value for an attribute
+    def rows_with(self, key, value):
+        return self.by_attribute[key].get(value, np.empty(0, dtype=np.intp))
+
+    # a random puzzle, used when nothing matches the user preferences
+    def random_puzzle(self):
+        return self.puzzle(random.randrange(len(self)))
+
+
+# read a catalog from a CSV, Parquet or JSON lines file
+def read_catalog(path=CATALOG_PATH):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        frame = pd.read_parquet(path)
+    elif extension in (".jsonl", ".json"):
+        frame = pd.read_json(path, lines=True)
+    else:
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return PuzzleCatalog(frame)
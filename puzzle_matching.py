@@ -0,0 +1,237 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import fuzzy_matching
+
+# the six questions of the "Find Your Puzzle!" page with the name of the matching catalog column and the answer
+# options, the puzzle attributes are stored in the same order as these questions
+QUESTIONS = [
+    ("motif", "Do you prefer Landscape or Ocean?", ["Landscape", "Ocean", "Mountains", "Desert"]),
+    ("detail", "Do you prefer detailed or undetailed?", ["Detailed", "Undetailed"]),
+    ("setting", "Do you prefer city or nature?", ["City", "Nature", "Coastal town"]),
+    ("pieces", "Do you prefer a lot of pieces or fewer pieces?", ["A lot of pieces", "Fewer pieces"]),
+    ("style", "Do you prefer a realistic image or a cartoon image?", ["Realistic", "Cartoon"]),
+    ("colours", "Do you prefer colourful or monochrome?", ["Colourful", "Monochrome", "Earth tones"]),
+]
+
+# names of the catalog columns that hold the puzzle attributes
+ATTRIBUTES = [key for key, _, _ in QUESTIONS]
+
+# attribute values that are at least this similar to an answer option are treated as that option,
+# so "Colorful" and "Realisitc" end up as "Colourful" and "Realistic"
+NORMALIZE_CUTOFF = 85
+
+
+# answer that leaves a question out of the score, offered on the preference page next to the answer options
+NO_PREFERENCE = "No preference"
+
+
+# matching engine that encodes every puzzle once as a row of attribute ids and then scores all puzzles
+# against the user preferences with table lookups instead of comparing the texts of every puzzle on every click
+class PuzzleMatcher:
+    # columns holds one sequence of attribute values per question, all of the same length
+    def __init__(self, columns, questions=QUESTIONS):
+        self.keys = [key for key, _, _ in questions]
+        # one vocabulary per question, starting with the answer options as the canonical values
+        self.vocabularies = [list(options) for _, _, options in questions]
+        self.option_counts = [len(options) for _, _, options in questions]
+        self.size = len(columns[0]) if columns else 0
+        self.codes = np.zeros((self.size, len(questions)), dtype=np.int32)
+
+        for column, values in enumerate(columns[:len(questions)]):
+            # only the distinct values of a column have to be normalized, not every puzzle
+            value_codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(""))
+            lookup = {value: index for index, value in enumerate(self.vocabularies[column])}
+            ids = np.array([self._encode(value, column, lookup) for value in uniques], dtype=np.int32)
+            self.codes[:, column] = ids[value_codes]
+
+        # many puzzles share the same attributes, so every distinct combination (profile) is only scored once and
+        # the puzzles get the score of their profile
+        # the ids of a puzzle are combined into one number first, which is much faster to make unique than rows
+        sizes = np.array([len(vocabulary) for vocabulary in self.vocabularies], dtype=np.int64)
+        multipliers = np.concatenate(([1], np.cumprod(sizes[:0:-1])))[::-1]
+        _, first, self.profile_of = np.unique(self.codes @ multipliers, return_index=True, return_inverse=True)
+        self.profiles = self.codes[first]
+
+        # similarity of every answer option to every value in the vocabulary of its question, computed once with
+        # cdist, answer -> similarity to every vocabulary id
+        self.similarities = []
+        for count, vocabulary in zip(self.option_counts, self.vocabularies):
+            options = vocabulary[:count]
+            matrix = fuzzy_matching.cdist(options, vocabulary)
+            self.similarities.append(dict(zip(options, matrix)))
+
+    # map an attribute value to its id in the vocabulary of the question, adding it if it is unknown
+    def _encode(self, value, column, lookup):
+        if value in lookup:
+            return lookup[value]
+
+        vocabulary = self.vocabularies[column]
+        options = vocabulary[:self.option_counts[column]]
+        match = fuzzy_matching.extract_one(value, options, cutoff=NORMALIZE_CUTOFF)
+        if match is not None:
+            lookup[value] = match[2]
+        else:
+            # unknown values keep their own id and are still compared fuzzily when scoring
+            vocabulary.append(value)
+            lookup[value] = len(vocabulary) - 1
+        return lookup[value]
+
+    # the answers in the order of the questions, from a dict question key -> answer or from a list in question order,
+    # questions without an answer or with NO_PREFERENCE are None
+    def answers(self, user_preferences):
+        if isinstance(user_preferences, dict):
+            answers = [user_preferences.get(key) for key in self.keys]
+        else:
+            answers = list(user_preferences)[:len(self.keys)]
+            answers += [None] * (len(self.keys) - len(answers))
+        return tuple(None if answer in (None, "", NO_PREFERENCE) else answer for answer in answers)
+
+    # the weight of every question in question order, from a dict question key -> weight (missing keys weigh 1) or
+    # from a list in question order, scaled so the largest weight is 1 because only the ratios change the scores
+    def weights(self, weights=None):
+        if weights is None or isinstance(weights, dict):
+            weights = [(weights or {}).get(key, 1) for key in self.keys]
+        weights = [max(float(weight), 0.0) for weight in weights]
+        largest = max(weights, default=0.0) or 1.0
+        return tuple(weight / largest for weight in weights)
+
+    # similarity of an answer to every value in the vocabulary of a question, answers that are not one of the
+    # options are compared once and then kept in the table as well
+    def _similarity(self, column, answer):
+        similarity = self.similarities[column].get(answer)
+        if similarity is None:
+            similarity = fuzzy_matching.cdist([answer], self.vocabularies[column])[0]
+            self.similarities[column][answer] = similarity
+        return similarity
+
+    # similarity of some profiles to the user preferences, the weighted average over all questions with an answer
+    def _profile_scores(self, profiles, user_preferences, weights):
+        answers = self.answers(user_preferences)
+        weights = self.weights(weights)
+        total = np.zeros(len(profiles), dtype=np.float64)
+        weight_sum = 0.0
+        for column, (answer, weight) in enumerate(zip(answers, weights)):
+            if answer is None or weight <= 0:
+                continue
+            total += weight * self._similarity(column, answer)[profiles[:, column]]
+            weight_sum += weight
+        if weight_sum == 0:
+            # nothing to compare, so no puzzle matches
+            return np.zeros(len(profiles), dtype=np.float64)
+        return total / weight_sum
+
+    # similarity of every puzzle to the user preferences
+    def scores(self, user_preferences, weights=None):
+        return self._profile_scores(self.profiles, user_preferences, weights)[self.profile_of]
+
+    # similarity of only some puzzles to the user preferences, the same as scores(...)[rows]
+    def scores_of(self, rows, user_preferences, weights=None):
+        return self._profile_scores(self.codes[np.asarray(rows, dtype=np.intp)], user_preferences, weights)
+
+    # row numbers of the k highest scores, best first, without sorting all scores
+    @staticmethod
+    def _best_rows(scores, k):
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+        if k == 1:
+            # argmax returns the first of several equal scores, just like the old loop did
+            return np.array([np.argmax(scores)])
+        # partition finds the k-th best score in linear time, every puzzle with a better score is in the top k and
+        # the rest is filled with the first puzzles in catalog order that have exactly the k-th score, so ties end
+        # up in catalog order like in the old loop, only those k are sorted afterwards
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        better = np.flatnonzero(scores > kth)
+        best = np.concatenate((better, np.flatnonzero(scores == kth)[:k - len(better)]))
+        return best[np.lexsort((best, -scores[best]))]
+
+    # return the row numbers and scores of the k best puzzles, best first
+    def top_matches(self, user_preferences, k=5, threshold=0, weights=None):
+        scores = self.scores(user_preferences, weights)
+        return [(int(row), float(scores[row])) for row in self._best_rows(scores, k)
+                if scores[row] >= threshold and scores[row] > 0]
+
+    # why a puzzle got its score: for every question its key, the answer, the (normalized) attribute of the puzzle
+    # and how similar they are, None for questions without an answer
+    def breakdown(self, row, user_preferences):
+        answers = self.answers(user_preferences)
+        breakdown = []
+        for column, (key, answer) in enumerate(zip(self.keys, answers)):
+            code = self.codes[row, column]
+            similarity = None if answer is None else float(self._similarity(column, answer)[code])
+            breakdown.append((key, answer, self.vocabularies[column][code], similarity))
+        return breakdown
+
+    # like top_matches, but also explains every score with its breakdown
+    def rank(self, user_preferences, k=5, threshold=0, weights=None):
+        answers = self.answers(user_preferences)
+        scores = self.scores(answers, weights)
+        return [(int(row), float(scores[row]), self.breakdown(row, answers)) for row in self._best_rows(scores, k)
+                if scores[row] >= threshold and scores[row] > 0]
+
+    # same result as the old loop: the row of the best puzzle above the threshold, or None and a score of 0
+    def find_best_puzzle(self, user_preferences, threshold=70, weights=None):
+        matches = self.top_matches(user_preferences, k=1, threshold=threshold, weights=weights)
+        if not matches:
+            return None, 0
+        return matches[0]
+
+
+# process-wide cache of rankings: the questions only allow 4*2*3*2*2*3 = 288 combinations of answers (more with
+# "No preference" and the weights), so after the first time (or after precompute) a recommendation is just a
+# dictionary lookup
+# the cache belongs to one matcher, a new catalog gets a new matcher and with it an empty cache
+class RecommendationCache:
+    def __init__(self, matcher, questions=QUESTIONS, maxsize=10_000):
+        self.matcher = matcher
+        self.questions = questions
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.precompute_seconds = None
+        self._results = {}
+        self._lock = threading.Lock()
+
+    # same as PuzzleMatcher.rank, but every combination of answers and weights is only ranked once
+    def rank(self, user_preferences, k=5, threshold=0, weights=None):
+        answers = self.matcher.answers(user_preferences)
+        weights = self.matcher.weights(weights)
+        key = (answers, weights, k, threshold)
+        ranking = self._results.get(key)
+        with self._lock:
+            if ranking is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if ranking is None:
+            ranking = self.matcher.rank(answers, k=k, threshold=threshold, weights=weights)
+            if len(self._results) < self.maxsize:
+                self._results[key] = ranking
+        return ranking
+
+    # rank all combinations of answers with equal weights at once, e.g. when the catalog is loaded
+    def precompute(self, k=5, threshold=0):
+        start = time.perf_counter()
+        weights = self.matcher.weights()
+        for answers in itertools.product(*(options for _, _, options in self.questions)):
+            key = (answers, weights, k, threshold)
+            if key not in self._results:
+                self._results[key] = self.matcher.rank(answers, k=k, threshold=threshold)
+        self.precompute_seconds = time.perf_counter() - start
+        return self.precompute_seconds
+
+    # hits, misses, hit rate, number of cached rankings and how long the precompute took
+    def report(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached": len(self._results),
+            "precompute_ms": None if self.precompute_seconds is None else self.precompute_seconds * 1000,
+        }
@@ -1,140 +1,64 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
+import hmac
+import os
 import random
-from rapidfuzz import fuzz
-from fuzzywuzzy import process
+import sqlite3
+import tempfile
+from puzzle_catalog import CATALOG_PATH, read_catalog
+from puzzle_matching import NO_PREFERENCE, QUESTIONS
+from review_store import DuplicateReview, ReviewStore
+from review_similarity import SimilarityJob, blend
+from gallery import gallery
+from image_cache import image_for, remote_images, thumbnail_for
+from metrics import deep_size, metrics
+from portal_content import HOBBIES, JOURNEY_GALLERY, MESSAGES, SIDEBAR_CSS, THEME_CSS, WELCOME_IMAGES
 
 st.set_page_config(page_title="Welcome to PuzzlePortal")
 
 
-# function for changing colors
+# function for changing colors, the CSS of every theme is only built once when the app starts
 def set_theme(theme_name):
-    themes = {
-        "Blue": {
-            "primary_color": "#80c9ff",  # light medium blue
-            "background_color": "#bfe4ff",  # bright blue
-            "text_color": "#0066b3",  # medium blue
-            "header_color": "#00487d"  # dark blue
-        },
-        "Purple": {
-            "primary_color": "#9267AA",  # medium purple
-            "background_color": "#9267AA",  # Dark purple
-            "text_color": "#D1CCFF",  # light medium purple
-            "header_color": "#E2CCFF"  # bright purple
-        },
-        "Brown": {
-            "primary_color": "#bf8860",  # medium brown
-            "background_color": "#806959",  # Dark brown
-            "text_color": "#cca88f",  # light medium brown
-            "header_color": "#e6d8cf"  # bright brown
-        },
-        "Green": {
-            "primary_color": "#00b069",  # medium green
-            "background_color": "#007b49",  # Dark green
-            "text_color": "#80ffcc",  # light medium green
-            "header_color": "#bfffe5"  # bright green
-        }
-    }
-
-    # If the theme is valid, apply custom css, here I had help from ChatGPT
-    if theme_name in themes:
-        theme = themes[theme_name]
-        custom_css = f"""
-        <style>
-            :root {{
-                --primary-color: {theme['primary_color']};
-                --background-color: {theme['background_color']};
-                --text-color: {theme['text_color']};
-                --header-color: {theme['header_color']};
-            }}
-
-            /* Apply background color and text color with higher specificity */
-            html, body, div.stApp {{
-                background-color: var(--background-color) !important;
-                color: var(--text-color) !important;
-            }}
-
-            h1, h2, h3, h4, h5, h6 {{
-                color: var(--header-color) !important;
-            }}
-
-            /* Streamlit-specific class adjustments */
-            .css-18e3th9 {{
-                background-color: var(--background-color) !important;
-                color: var(--text-color) !important;
-            }}
-
-            .stButton > button {{
-                background-color: var(--primary-color) !important;
-                color: var(--text-color) !important;
-            }}
-
-            .stTextInput > div > div input {{
-                background-color: var(--background-color) !important;
-                color: var(--text-color) !important;
-            }}
-
-            .css-1cpxqw2 {{
-                background-color: var(--background-color) !important;
-            }}
-        </style>
-        """
-        st.markdown(custom_css, unsafe_allow_html=True)
+    # If the theme is valid, apply custom css
+    if theme_name in THEME_CSS:
+        st.markdown(THEME_CSS[theme_name], unsafe_allow_html=True)
 
 
 # create a sidebar for selecting different pages and the different color themes defined above
 st.sidebar.header("Menu")
-st.markdown("""
-<style>
-    [data-testid=stSidebar] {
-        background-color: #596f80;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(SIDEBAR_CSS, unsafe_allow_html=True)
 
 # list of the page options in the sidebar
 options = ['Welcome To PuzzlePortal', 'Find Your Puzzle!', 'Reviews', 'Get Inspired!', 'My Puzzle Journey']
+# the admin page is hidden and only shows up with ?admin=1 in the address
+if st.query_params.get("admin") == "1":
+    options.append("Admin")
+# anybody can open the admin page, but importing and exporting all reviews also needs this token, without it they
+# are only possible on the command line (python review_store.py import or export)
+ADMIN_TOKEN = os.environ.get("PUZZLE_PORTAL_ADMIN_TOKEN", "")
 page_selection = st.sidebar.selectbox("Choose the page", options)
 
 # list of the color themes in the sidebar
 st.sidebar.header("Design")
-theme_name = st.sidebar.selectbox("Which colour theme do you prefer",
-                                  ["Blue", "Purple", "Brown", "Green"], index=0)
+theme_name = st.sidebar.selectbox("Which colour theme do you prefer", list(THEME_CSS), index=0)
 # apply the selected theme
 set_theme(theme_name)
 
 
 # definition for random pop-up messages
 def random_message():
-    # list of pop-up messages
-    messages = [
-        "Hey there! Just finished my puzzle—took me 15 minutes. What’s your time looking like?",
-        "Pro tip: Start with the corners; it’s a game changer!",
-        "How’s it going? I always find the edges first; works for me!",
-        "Wow, I just unlocked a 6x6 grid. Have you tried it yet?",
-        "Did you know the world’s largest jigsaw puzzle had over 500,000 pieces? Imagine that!",
-        "Almost there? I can’t wait to see the finished puzzle!",
-        "You’re doing amazing—keep it up! Don’t let that one tricky piece fool you.",
-        "Fun fact: Puzzles were invented in the 1760s. You're part of a historic tradition!",
-        "Think of it like life: one piece at a time, and it all fits together.",
-        "Need a break? Sometimes a fresh perspective makes all the difference!",
-        "I just unlocked a cat-themed puzzle—so adorable! What’s your favorite theme?",
-        "Have you tried rotating pieces? Sometimes the solution’s simpler than you think.",
-        "Challenge accepted! I’m trying to beat your time on the last puzzle.",
-        "Puzzles are like meditation for the brain. Feeling zen yet?",
-        "Wow, your puzzle looks great! Want to swap tips on tough spots?",
-        "I love how satisfying it is when the final piece clicks. Almost there?",
-        "You’re inspiring me! I might take on a harder level next.",
-        "Stuck? Look at the colors and patterns—it always helps me!",
-        "I just discovered there’s a world championship for puzzling. Should we enter?",
-        "Way to go, puzzler extraordinaire! I’m cheering you on from here!",
-    ]
-
     # randomly choose one of the messages and make it appear in the upper right corner with st.toast
-    message = random.choice(messages)
+    message = random.choice(MESSAGES)
     st.toast(message)
 
 
+# width in pixels of the images in the two columns of the welcome page and of a recommended puzzle, twice the width
+# on the screen so they stay sharp on high resolution screens
+WELCOME_COLUMN_WIDTH = 2 * 340
+PUZZLE_IMAGE_WIDTH = 2 * 704
+
+
 # definition for the page that will be displayed first when opening the website
 # the information texts on the page are based on the following website: https://www.puzzle.de/puzzle-geschichte/
 def welcome_page():
@@ -152,14 +76,12 @@ def welcome_page():
     def info_puzzling_one():
         tile = st.container()
         # images and texts that will be shown in the container
-        tile.image("https://images.unsplash.com/photo-1621211255064-8915268b62f4?q=80&w=2340&auto=format&fit=crop"
-                   "&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D")
+        tile.image(image_for(WELCOME_IMAGES[0], WELCOME_COLUMN_WIDTH))
         tile.write("The first puzzle was made in 1766 by John Spilsbury, a British mapmaker. He cut a map into small "
                    "pieces to help students learn geography in a fun way. Over time, puzzles changed from simple "
                    "wooden pieces to colorful pictures with thousands of parts. Today, people enjoy puzzles of all "
                    "kinds, from famous paintings to personal photos.")
-        tile.image("https://images.unsplash.com/photo-1688930495342-eac24a42d65a?q=80&w=2348&auto=format&fit=crop"
-                   "&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D")
+        tile.image(image_for(WELCOME_IMAGES[1], WELCOME_COLUMN_WIDTH))
         tile.write("Today, puzzles are still a great way to have fun and take a break from daily life. They bring "
                    "families and friends closer and give a sense of achievement when finished. No matter if it’s a "
                    "rainy day or a quiet evening at home, puzzles make every moment more enjoyable.")
@@ -172,12 +94,12 @@ def welcome_page():
                    "fun game – they make us think, help us relax, and bring people together. Looking for the right "
                    "piece and putting it in the right place feels exciting and satisfying. That’s why puzzles are a "
                    "favorite activity for kids and adults alike.")
-        tile.image("https://www.historytoday.com/sites/default/files/2021-03/Jigsaws.jpg")
+        tile.image(image_for(WELCOME_IMAGES[2], WELCOME_COLUMN_WIDTH))
         tile.write("Puzzles are not just for children. Many adults love solving them because they are both "
                    "challenging and relaxing. Puzzling helps train the brain by improving focus, patience, "
                    "and problem-solving skills. Whether you are working on a small puzzle or a giant one with "
                    "thousands of pieces, it is always exciting to see the picture slowly come together.")
-        tile.image("https://m.media-amazon.com/images/I/71egJKcfAiL.jpg")
+        tile.image(image_for(WELCOME_IMAGES[3], WELCOME_COLUMN_WIDTH))
 
     # displaying the information in the two columns
     with c1:
@@ -186,137 +108,249 @@ def welcome_page():
     with c2:
         info_puzzling_two()
 
+# names of the shared resources (catalog, reviews, similarities) that a page already created, the metrics only report
+# those, so writing the metrics never loads the catalog or opens the review database on a page that does not need it
+@st.cache_resource
+def loaded_resources():
+    return set()
+
+
+# load the puzzle catalog only once per process and share it between all sessions, the modification time of the
+# file is part of the cache key so the catalog is reloaded when the file changes
+# the recommendations for all combinations of answers are computed right away, unless PUZZLE_PORTAL_PRECOMPUTE=0
+@st.cache_resource(max_entries=1)
+def load_catalog(path, modified):
+    catalog = read_catalog(path)
+    loaded_resources().add("catalog")
+    if os.environ.get("PUZZLE_PORTAL_PRECOMPUTE", "1") == "1":
+        catalog.recommendations.precompute(k=MATCHES_SHOWN, threshold=MATCH_THRESHOLD)
+    return catalog
+
+
+# function for getting the current puzzle catalog
+def get_catalog():
+    return load_catalog(CATALOG_PATH, os.path.getmtime(CATALOG_PATH))
+
+
+# number of puzzles recommended on the preference page and the lowest score in percent a recommendation needs
+MATCHES_SHOWN = 5
+MATCH_THRESHOLD = 70
+
+# number of puzzles shown for a search
+SEARCH_RESULTS = 6
+
+
 # definition for the preference page
 def preference_page():
     random_message() # displaying the random messages with st.toast
 
-    # list of puzzles, each with its name, image URL, and attributes (landscape, detailed, etc.)
-    puzzles = [
-        {
-            "name": "Lavendelfeld zur goldenen Sonne 16724",
-            "image_url": "https://m.media-amazon.com/images/I/61qBAseyBBL._AC_UF1000,1000_QL80_.jpg",
-            "attributes": ["Landscape", "Detailed", "Nature", "Fewer pieces", "Realistic", "Colourful"]
-        },
-        {
-            "name": "Guanajuato in Mexiko 17442",
-            "image_url": "https://m.media-amazon.com/images/I/611tjCHSSoL._AC_UF1000,1000_QL80_.jpg",
-            "attributes": ["Landscape", "Detailed", "City", "A lot of pieces", "Realistic", "Monochrome"]
-        },
-        {
-            "name": "Magische Stimmung über dem Leuchtturm von Akranes, Island 12000732",
-            "image_url": "https://m.media-amazon.com/images/I/61OpG-BKUwL._AC_UF894,1000_QL80_.jpg",
-            "attributes": ["Landscape", "Detailed", "Coastal town", "A lot of pieces", "Realistic", "Earth tones"]
-        },
-        {
-            "name": "Schlacht auf hoher See 13969",
-            "image_url": "https://m.media-amazon.com/images/I/71EGLaamQcL.jpg",
-            "attributes": ["Ocean", "Detailed", "Coastal town", "A lot of pieces", "Cartoon", "Earth tones"]
-        },
-        {
-            "name": "Geheimnisvolle Unterwasserwelt 16661",
-            "image_url": "https://i.pinimg.com/736x/cb/5a/03/cb5a038c26f04bd30b73bbd53be4becc.jpg",
-            "attributes": ["Ocean", "Undetailed", "Nature", "A lot of pieces", "Cartoon", "Monochrome"]
-        },
-        {
-            "name": "Almbock mit Baby 12000809",
-            "image_url": "https://scale.coolshop-cdn.com/product-media.coolshop-cdn.com/23JB8Y/8326844d67cc442bbaf1bc8f6aaf5510.jpg/f/ravensburger-puzzle-foto-city-landscape-3000p-12000809.jpg",
-            "attributes": ["Mountains", "Detailed", "Nature", "A lot of pieces", "Realistic", "Colourful"]
-        },
-        {
-            "name": "Regenbogenberge, China 17324",
-            "image_url": "https://m.media-amazon.com/images/I/71zg-x0qpmL._AC_UF894,1000_QL80_.jpg",
-            "attributes": ["Mountains", "Detailed", "Nature", "Fewer pieces", "Realistic", "Colorful"]
-        },
-        {
-            "name": "Zauberhafte Wüste 15069",
-            "image_url": "https://m.media-amazon.com/images/I/81-4l9-nVaL.jpg",
-            "attributes": ["Desert", "Detailed", "Nature", "Fewer pieces", "Realistic", "Earth tones"]
-        },
-        {
-            "name": "In den Dünen 146130",
-            "image_url": "https://m.media-amazon.com/images/I/91MMqfZH-AL.jpg",
-            "attributes": ["Ocean", "Undetailed", "Coastal town", "Fewer pieces", "Realisitc", "Earth tones"]
-        },
-        {
-            "name": "Wasserfall von Kirkjufell, Island 19539",
-            "image_url": "https://m.media-amazon.com/images/I/61WOdfMmGrL.jpg",
-            "attributes": ["Mountains", "Undetailed", "Coastal town", "Fewer pieces", "Realistic", "Earth tones"]
-        },
-        {
-            "name": "Pokémon Classics 12000726",
-            "image_url": "https://data.puzzle.de/.5/pokemon-classics-1500-teile--puzzle.91804-2.fs.jpg",
-            "attributes": ["Landscape", "Undetailed", "City", "A lot of pieces", "Cartoon", "Colorful"]
-        },
-    ]
-
-    # function for finding the best puzzle match based on the user preferences with fuzzywuzzy
-    def find_best_puzzle(user_preferences, puzzles, threshold=70):
-        best_match = None # initialize the best match to none
-        highest_score = 0 # initialize the highest score to 0
-
-        for puzzle in puzzles:
-            # Compare each attribute of the puzzle to the user preferences using fuzz.ratio to get a similarity score
-            scores = [fuzz.ratio(user_attr, puzzle_attr) for user_attr, puzzle_attr in
-                      zip(user_preferences, puzzle["attributes"])]
-            avg_score = sum(scores) / len(scores) # Calculate the average score
-
-            # if the average score is higher than the current highest score and meets the threshold, update the match
-            if avg_score > highest_score and avg_score >= threshold:
-                highest_score = avg_score
-                best_match = puzzle
-
-        return best_match, highest_score # return the best match and its score
+    # function for finding the best puzzle matches based on the user preferences and how important every question
+    # is, the scoring itself is done by the cached matching engine with table lookups and every combination of
+    # answers and weights is only scored once, then the puzzles that people with the same taste liked move up,
+    # which only looks up the item similarities of the background job
+    # returns the puzzles with their score, how well every attribute matched and how much people like you liked
+    # them, best first
+    def find_best_puzzles(user_preferences, catalog, weights=None, k=MATCHES_SHOWN, threshold=MATCH_THRESHOLD,
+                          name=None):
+        return [(catalog.puzzle(row), score, breakdown, liked) for row, score, breakdown, liked in
+                blend(catalog, get_similarity_job().similarity, user_preferences, weights, k, threshold, name)]
+
+    # definition for showing why a puzzle was recommended
+    def show_breakdown(tile, breakdown):
+        with tile.expander("Why this puzzle?"):
+            st.dataframe(pd.DataFrame(
+                [(key.capitalize(), NO_PREFERENCE if answer is None else answer, value,
+                  "–" if similarity is None else f"{similarity:.0f}%")
+                 for key, answer, value, similarity in breakdown],
+                columns=["Question", "Your answer", "This puzzle", "Match"]), hide_index=True)
+
+    # definition for showing that people with the same taste liked a puzzle
+    def show_liked(tile, liked):
+        if liked > 0:
+            tile.caption(f"👥 Liked by people with your taste ({liked:.0%} similar)")
+
+    # definition for searching puzzles by name, attribute or item number, typos are okay
+    def search():
+        query = st.text_input("Search puzzles", placeholder="e.g. Leuchtturm Island or 12000732")
+        if not query:
+            return
+        catalog = get_catalog()
+        with metrics.timed("section", "search"):
+            results = catalog.search(query, limit=SEARCH_RESULTS)
+        if not results:
+            st.write(f"No puzzles found for \"{query}\".")
+            return
+        columns = st.columns(2)
+        for number, (row, score) in enumerate(results):
+            puzzle = catalog.puzzle(row)
+            tile = columns[number % 2].container(border=True)
+            tile.image(image_for(puzzle["image_url"], WELCOME_COLUMN_WIDTH), caption=puzzle["name"])
+            tile.write(f"Item number {puzzle['item_number']} ({score:.0f}% match)")
 
     # definition for gathering user preferences
     def preference():
         st.title("Find Your Perfect Puzzle!🌸🌟")
+        get_similarity_job() # starts the background job, so the similarities are ready when the button is clicked
+        search()
         st.write("Answer the following questions to find the best puzzle for you!")
 
-        # questions for user preferences
-        question1 = st.radio("Do you prefer Landscape or Ocean?", ["Landscape", "Ocean", "Mountains", "Desert"])
-        question2 = st.radio("Do you prefer detailed or undetailed?", ["Detailed", "Undetailed"])
-        question3 = st.radio("Do you prefer city or nature?", ["City", "Nature", "Coastal town"])
-        question4 = st.radio("Do you prefer a lot of pieces or fewer pieces?", ["A lot of pieces", "Fewer pieces"])
-        question5 = st.radio("Do you prefer a realistic image or a cartoon image?", ["Realistic", "Cartoon"])
-        question6 = st.radio("Do you prefer colourful or monochrome?", ["Colourful", "Monochrome", "Earth tones"])
+        # questions for user preferences, collected by question so the order of the questions does not matter
+        user_preferences = {key: st.radio(question, options + [NO_PREFERENCE]) for key, question, options in QUESTIONS}
 
-        # collect user preferences in a list
-        user_preferences = [question1, question2, question3, question4, question5, question6]
+        # how much every question counts, all questions are equally important unless the user changes it
+        with st.expander("How important is each question?"):
+            weights = {key: st.slider(key.capitalize(), min_value=1, max_value=5, value=3, key=f"weight_{key}")
+                       for key, _, _ in QUESTIONS}
+        # the puzzles the user liked on the reviews page are used to find puzzles that people with the same taste
+        # liked as well
+        name = st.text_input("Your name on the Reviews page (optional)", placeholder="Your Name").strip()
 
-        # find the best puzzle match when the button is clicked
+        # find the best puzzle matches when the button is clicked
         if st.button("Find My Puzzle!"):
-            best_match, score = find_best_puzzle(user_preferences, puzzles)
-
-            # if a match is found, display the puzzle with its image and score
-            if best_match:
+            catalog = get_catalog()
+            with metrics.timed("section", "find_best_puzzles"):
+                matches = find_best_puzzles(user_preferences, catalog, weights, name=name)
+            metrics.increment("recommendations")
+
+            # if a match is found, display the best puzzle with its image and score and the next best ones below it
+            if matches:
+                # the ratings of all recommended puzzles are read from the review summaries at once
+                ratings = get_review_store().ratings([puzzle["item_number"] for puzzle, _, _, _ in matches])
+                best_match, score, breakdown, liked = matches[0]
                 st.write(f"We found a match for you!🧩 ({score:.2f}% match)")
-                st.image(best_match["image_url"], caption=best_match["name"])
+                st.image(image_for(best_match["image_url"], PUZZLE_IMAGE_WIDTH), caption=best_match["name"])
+                st.write(rating_text(ratings, best_match["item_number"]))
+                show_liked(st, liked)
+                show_breakdown(st, breakdown)
+
+                if len(matches) > 1:
+                    st.subheader("More puzzles you might like")
+                    columns = st.columns(2)
+                    for number, (puzzle, score, breakdown, liked) in enumerate(matches[1:]):
+                        tile = columns[number % 2].container(border=True)
+                        tile.image(image_for(puzzle["image_url"], WELCOME_COLUMN_WIDTH), caption=puzzle["name"])
+                        tile.write(f"{score:.2f}% match, {rating_text(ratings, puzzle['item_number'])}")
+                        show_liked(tile, liked)
+                        show_breakdown(tile, breakdown)
             # if no match is found, show a random puzzle suggestion
             else:
                 st.write("No perfect match found, but here’s a random suggestion!")
-                random_puzzle = random.choice(puzzles)
-                st.image(random_puzzle["image_url"], caption=random_puzzle["name"])
+                random_puzzle = catalog.random_puzzle()
+                st.image(image_for(random_puzzle["image_url"], PUZZLE_IMAGE_WIDTH), caption=random_puzzle["name"])
 
     if __name__ == "__main__":
         preference()
 
+# open the review database only once per process, all sessions write through the same store
+@st.cache_resource
+def get_review_store():
+    store = ReviewStore()
+    loaded_resources().add("reviews")
+    return store
+
+
+# the item similarities from the reviews are built by a background job that only reads the new reviews, so a
+# recommendation just looks them up
+@st.cache_resource
+def get_similarity_job():
+    job = SimilarityJob(get_review_store())
+    loaded_resources().add("similarity")
+    return job
+
+
+# number of reviews shown on one page of the review browser and number of puzzles in the top rated list
+REVIEWS_PER_PAGE = 20
+TOP_RATED_SHOWN = 10
+
+# up to this many puzzles the item number of a review is picked from a list, for bigger catalogs it is typed in
+AUTOCOMPLETE_LIMIT = 5000
+
+
+# definition for the rating of a puzzle, ratings is a dict item number -> (number of reviews, average stars)
+def rating_text(ratings, item_number):
+    if item_number not in ratings:
+        return "No reviews yet"
+    count, average = ratings[item_number]
+    return f"{average:.1f} ⭐ from {count} review{'' if count == 1 else 's'}"
+
+
+# definition for the list of the best rated puzzles, it is read from the summaries that are updated with every review
+def top_rated(store):
+    st.subheader("Top rated puzzles")
+    min_reviews = st.number_input("Only puzzles with at least this many reviews", min_value=1, value=1, step=1,
+                                  key="top_min_reviews")
+    best = store.top_rated(limit=TOP_RATED_SHOWN, min_reviews=min_reviews)
+    if best.empty:
+        st.write("No puzzle has that many reviews yet.")
+        return
+    best.insert(0, "Puzzle", get_catalog().details(best["Item Number"])["Puzzle"])
+    st.dataframe(best, hide_index=True, column_config={
+        "Average": st.column_config.NumberColumn(format="%.1f ⭐"),
+        "Histogram": st.column_config.BarChartColumn("1 to 5 stars", y_min=0),
+    })
+
+
+# definition for browsing the saved reviews with filters, sorting and pages
+def review_browser(store):
+    # filters for the reviews
+    c1, c2, c3 = st.columns(3)
+    item_filter = c1.text_input("Filter by item number", key="review_item_filter")
+    min_stars, max_stars = c2.slider("Stars", min_value=1, max_value=5, value=(1, 5), key="review_star_filter")
+    text_filter = c3.text_input("Search in comments", key="review_text_filter")
+    filters = dict(item_number=item_filter, min_stars=min_stars, max_stars=max_stars, text=text_filter)
+
+    # sorting of the reviews
+    c1, c2 = st.columns(2)
+    sort = c1.selectbox("Sort by", ["Date", "Stars"], key="review_sort")
+    descending = c2.radio("Order", ["Descending", "Ascending"], horizontal=True, key="review_order") == "Descending"
+
+    # the average rating of the filtered item comes from the summary that is updated with every review
+    if item_filter:
+        count, average = store.item_rating(item_filter)
+        if count:
+            st.write(f"Item {item_filter.strip()}: {average:.1f} ⭐ on average from {count} reviews")
+
+    total = store.count(**filters)
+    if not total:
+        st.write("No reviews match your filters.")
+        return
+
+    pages = (total + REVIEWS_PER_PAGE - 1) // REVIEWS_PER_PAGE
+    # go back to the last page if the filters leave fewer pages than before
+    if st.session_state.get("review_page", 1) > pages:
+        st.session_state.review_page = pages
+    page = st.number_input("Page", min_value=1, max_value=pages, step=1, key="review_page")
+    reviews = store.read_reviews(offset=(page - 1) * REVIEWS_PER_PAGE, limit=REVIEWS_PER_PAGE, sort=sort,
+                                 descending=descending, **filters)
+    # the puzzle of every review on this page, looked up in the catalog index all at once, the pictures come from
+    # the image cache like everywhere else, so the browser does not load them from the other websites
+    details = get_catalog().details(reviews["Item Number"])
+    reviews.insert(0, "Image", [thumbnail_for(image) for image in details["Image"]])
+    reviews.insert(2, "Puzzle", details["Puzzle"])
+    st.dataframe(reviews, hide_index=True, column_config={"Image": st.column_config.ImageColumn(width="small")})
+    st.caption(f"Page {page} of {pages} ({total} reviews)")
+
+
 # definition for the review page
 def review_page():
     st.title("Review Page")
     st.write("You have an opinion on a puzzle? Here is the place to write your review!")
     random_message()
 
-    # create a DataFrame to store reviews, with help from the TechBasics tutors
-    df_reviews = pd.DataFrame(columns=["Item Number", "Name", "Stars", "Comment"])
+    # the reviews are stored in a database that is shared by all sessions
+    store = get_review_store()
 
-    # load the data
-    if "df_reviews" not in st.session_state:
-        st.session_state.df_reviews = pd.DataFrame(columns=["Item Number", "Name", "Stars", "Comment"])
-
-    # form for adding new reviews
+    # form for adding new reviews, the item number can be picked from the catalog by typing a part of the name or
+    # the number, unless the catalog is too big to send all puzzles to the browser
+    catalog = get_catalog()
     with st.form("review_form"):
         st.subheader("Add a new review!")
-        item_number = st.text_input("Item Number", placeholder="e.g. 123456")
+        if len(catalog.by_item_number) <= AUTOCOMPLETE_LIMIT:
+            item_number = st.selectbox("Item Number", list(catalog.by_item_number), index=None,
+                                       format_func=lambda number: catalog.frame["name"].iat[catalog.find(number)],
+                                       placeholder="Type the name or the item number of the puzzle")
+        else:
+            item_number = st.text_input("Item Number", placeholder="e.g. 123456")
         name = st.text_input("Name", placeholder="Your Name")
         stars = st.slider("Stars", min_value=1, max_value=5, step=1)
         comment = st.text_area("Comment", placeholder="Write your comment here...")
@@ -324,23 +358,31 @@ def review_page():
 
     # save the data when the form is submitted
     if submit_button:
-        if item_number and name and comment: # makes sure all fields are filled
-            new_review = {
-                "Item Number": item_number,
-                "Name": name,
-                "Stars": stars,
-                "Comment": comment
-            }
-            new_review = pd.DataFrame([new_review]) # convert the new review to a DataFrame
-            st.session_state.df_reviews = pd.concat([st.session_state.df_reviews, new_review], ignore_index=True) # add review to session state
-            st.success("Review saved successfully!")
-        else:
+        if not (item_number and name and comment): # makes sure all fields are filled
             st.error("Please fill out everything.") # show an error if some fields are empty
+        elif catalog.find(item_number) is None: # makes sure the puzzle exists
+            st.error(f"There is no puzzle with the item number {item_number.strip()}.")
+        else:
+            try:
+                with metrics.timed("section", "review_save"):
+                    store.add_review(item_number, name, stars, comment) # add review to the database
+            except DuplicateReview: # the same person already wrote this review for this puzzle
+                metrics.increment("reviews_duplicate")
+                st.error("You already wrote this review for this puzzle.")
+            except (sqlite3.Error, TimeoutError): # the database is busy or broken, the review can be saved again later
+                metrics.increment("reviews_failed")
+                st.error("Your review could not be saved right now, please try again in a moment.")
+            else:
+                metrics.increment("reviews_saved")
+                st.success("Review saved successfully!")
+
+    if store.count():
+        top_rated(store)
 
-    # displaying the saved reviews
+    # displaying the saved reviews, only the selected page is read from the database and sent to the browser
     st.subheader("Saved Reviews")
-    if not st.session_state.df_reviews.empty:
-        st.dataframe(st.session_state["df_reviews"])
+    if store.count():
+        review_browser(store)
     else:
         st.write("No reviews yet.")
 
@@ -351,121 +393,13 @@ def inspiration_page():
              "offer similar creativity, challenge, and relaxation.")
     random_message()
 
-    # create three columns with different hobbies
-    c1, c2, c3 = st.columns(3)
-
-    # function for displaying information about Origami
-    def origami_info():
-        tile = st.container(border=True)
-        tile.title("Origami")
-        tile.image("https://www.japanwelt.de/media/image/origami-figuren-tiere-falten.jpg")
-        tile.write("Origami is the Japanese art of paper folding, transforming a simple sheet into intricate designs "
-                   "like animals, flowers, and geometric shapes. It promotes creativity, patience, and fine motor "
-                   "skills.")
-
-    # function for displaying information about Knitting
-    def knitting_info():
-        tile = st.container(border=True)
-        tile.title("Knitting")
-        tile.image("https://nimble-needles.com/wp-content/uploads/2021/09/how-to-knit-for-beginners-720x720.jpg")
-        tile.write("Knitting is a relaxing craft where yarn is looped together to create textiles, from scarves to "
-                   "sweaters. It’s a meditative activity that enhances focus and creativity while producing beautiful "
-                   "handmade items.")
-
-    # function for displaying information about Sudoku
-    def sudoku_info():
-        tile = st.container(border=True)
-        tile.title("Sudoku")
-        tile.image("https://sudoku-puzzles.net/wp-content/puzzles/butterfly-sudoku/easy/1.png")
-        tile.write("Sudoku is a number puzzle that challenges logical thinking by requiring players to fill a grid so "
-                   "that each row, column, and section contain all digits exactly once. It’s a great mental workout that "
-                   "improves problem-solving skills.")
-
-    # function for displaying information about Crossword
-    def crossword_info():
-        tile = st.container(border=True)
-        tile.title("Cross- word")
-        tile.image("https://www.treevalleyacademy.com/wp-content/uploads/6th-Grade-Fall-Crossword-791x1024.png.webp")
-        tile.write("Crossword puzzles test vocabulary and general knowledge by asking players to fit words into a grid "
-                   "using given clues. They help expand language skills and keep the mind sharp.")
-
-    # function for displaying information about Coding
-    def coding_info():
-        tile = st.container(border=True)
-        tile.title("Coding")
-        tile.image("https://i.insider.com/60144316a7c0c4001991dde6?width=800&format=jpeg&auto=webp")
-        tile.write(
-            "Coding involves writing and structuring computer programs, similar to solving a puzzle with logic and "
-            "creativity. It enhances problem-solving skills and is used in everything from web development to "
-            "artificial intelligence.")
-
-    # function for displaying information about Wooden Puzzles
-    def wooden_puzzles_info():
-        tile = st.container(border=True)
-        tile.title("Wooden Puzzles")
-        tile.image(
-            "https://magicholz.de/cdn/shop/files/LKB01-Classic-Gramophone-Robotime-ROKR-v10.png?v=1699300249&width=960")
-        tile.write(
-            "Wooden puzzles come in many forms, from interlocking pieces to handcrafted brain teasers. They offer "
-            "a tactile and engaging challenge that improves spatial reasoning and patience.")
-
-    # function for displaying information about Metal Puzzles
-    def metal_puzzles_info():
-        tile = st.container(border=True)
-        tile.title("Metal Puzzles")
-        tile.image(
-            "https://www.kastner-oehler.de/metal+earth-3d+metallbausatz+-+star+wars+-+sith+tie+fighter-1-768_1024_75-7429781_1.webp")
-        tile.write(
-            "Metal puzzles involve disentangling linked rings, wires, or shapes, requiring a mix of dexterity and "
-            "logical thinking. They are fun and satisfying brain teasers that test patience and problem-solving "
-            "skills.")
-
-    # function for displaying information about Lego
-    def lego_info():
-        tile = st.container(border=True)
-        tile.title("Lego")
-        tile.image("https://lego.storeturkey.com.tr/millennium-falcon-v29-star-wars-lego-24646-33-B.jpg")
-        tile.write("Building with Lego allows for endless creativity, whether constructing detailed models or original "
-                   "designs. It enhances spatial awareness, engineering skills, and imagination in both children and "
-                   "adults.")
-
-    # function for displaying information about Painting
-    def painting_info():
-        tile = st.container(border=True)
-        tile.title("Painting")
-        tile.image("https://images.seattletimes.com/wp-content/uploads/2019/07/ross1_0723.jpg?d=1020x680")
-        tile.write(
-            "Painting is a creative expression that allows artists to bring their imagination to life using colors "
-            "and brushes. It can be a relaxing hobby that enhances focus, emotional expression, and artistic "
-            "skills while producing unique and personal artworks.")
-
-    # with the columns display the different hobbies
-    with c1:
-        origami_info()
-
-    with c2:
-        knitting_info()
-
-    with c3:
-        sudoku_info()
+    # display the hobbies in three columns, the images are loaded after all texts are shown
+    gallery(HOBBIES, key="hobbies", columns=3, batch_size=6, border=True)
 
-    with c1:
-        crossword_info()
-
-    with c2:
-        coding_info()
 
-    with c3:
-        wooden_puzzles_info()
-
-    with c1:
-        metal_puzzles_info()
-
-    with c2:
-        lego_info()
-
-    with c3:
-        painting_info()
+# width of a journey column in pixels, twice the width on the screen so the photos stay sharp on high resolution
+# screens
+JOURNEY_COLUMN_WIDTH = 2 * 340
 
 
 # definition for the journey page
@@ -479,46 +413,125 @@ def journey_page():
     st.subheader("Here are some impressions of me and my 🧩Puzzles🧩")
     random_message() # display random message with st.toast
 
-    # create two columns to display different puzzle images
-    c1, c2 = st.columns(2)
-
-    # definition for the first columns and the images displayed in it
-    def journey_images_one():
-        tile = st.container()
-        tile.image("images/IMG_2663.JPG")
-        tile.image("images/23E5963A-E0CA-4FEC-82F9-CC2BB34937C3.JPG")
-        tile.image("images/IMG_2661.JPG")
-        tile.image("images/IMG_3093.JPG")
-        tile.image("images/IMG_1187.jpg")
-        tile.image("images/9B63ECCC-7F06-4E37-B174-61DCA2E733A9 2.jpg")
-        tile.image("images/F089577B-648F-4F1D-A21C-6EFA02A326AA.jpg")
-        tile.image("images/7D140F56-97D3-4FE3-83BA-1C144F05C1D8 2.JPG")
-
-    # definition for the second columns and the images displayed in it
-    def journey_images_two():
-        tile = st.container()
-        tile.image("images/IMG_4876.JPG")
-        tile.image("images/IMG_2665.JPG")
-        tile.image("images/IMG_2097.jpg")
-        tile.image("images/IMG_2670.JPG")
-        tile.image("images/IMG_4036.JPG")
-        tile.image("images/IMG_2664.JPG")
-
-    # display the images in the columns
-    with c1:
-        journey_images_one()
-
-    with c2:
-        journey_images_two()
-
-# page selection: when the user selects a page, show the new content
-if page_selection == "Welcome To PuzzlePortal":
-    welcome_page()
-elif page_selection == "Find Your Puzzle!":
-    preference_page()
-elif page_selection == "Reviews":
-    review_page()
-elif page_selection == "Get Inspired!":
-    inspiration_page()
-elif page_selection == "My Puzzle Journey":
-    journey_page()
+    # display the photos in two columns as resized variants that fit the column, the original can be opened on
+    # click and more photos are loaded with a button
+    gallery(JOURNEY_GALLERY, key="journey", columns=2, batch_size=6,
+            column_width=JOURNEY_COLUMN_WIDTH, expandable=True)
+
+# numbers from the caches of the portal, they are added to the metrics export, only for the resources that were
+# already loaded by a page
+def cache_gauges():
+    gauges = {f"image_cache_{name}": value for name, value in remote_images.report().items()}
+    loaded = loaded_resources()
+    if "catalog" in loaded:
+        report = get_catalog().recommendations.report()
+        gauges.update({f"recommendation_cache_{name}": value for name, value in report.items() if value is not None})
+    if "reviews" in loaded:
+        store = get_review_store()
+        gauges["reviews"] = store.count()
+        gauges["reviews_flagged"] = store.flagged_count()
+        gauges.update({f"duplicate_check_{name}": value for name, value in store.duplicates.report().items()})
+    if "similarity" in loaded:
+        gauges.update({f"item_similarity_{name}": value for name, value in get_similarity_job().report().items()})
+    return gauges
+
+
+# definition for importing many reviews from a file and downloading all reviews, the import reads the file in
+# chunks so even very big files do not have to fit into memory at once
+def review_transfer(store):
+    st.subheader("Import and export reviews")
+    if not ADMIN_TOKEN:
+        st.info("Start the portal with PUZZLE_PORTAL_ADMIN_TOKEN to import and export reviews here, or use "
+                "python review_store.py import or export.")
+        return
+    token = st.text_input("Admin token", type="password", key="admin_token")
+    # compare_digest takes the same time however many characters are right
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        if token:
+            st.error("Wrong admin token.")
+        return
+
+    upload = st.file_uploader("Reviews file with the columns Item Number, Name, Stars, Comment and optionally Date",
+                              type=["csv", "parquet"], key="review_upload")
+    if upload is not None and st.button("Import reviews"):
+        try:
+            with metrics.timed("section", "review_import"):
+                report = store.import_reviews(upload, item_numbers=get_catalog().by_item_number)
+        except ValueError as error:
+            st.error(f"The file could not be imported: {error}")
+        else:
+            metrics.increment("reviews_imported", report["imported"])
+            st.success(f"{report['imported']} of {report['rows']} reviews imported, {report['rejected']} rejected, "
+                       f"{report['flagged']} flagged as possible spam.")
+            if report["errors"]:
+                st.dataframe(pd.DataFrame(report["errors"], columns=["Row", "Problem"]), hide_index=True)
+
+    # the export is only written when the button is clicked, into a temporary file instead of a DataFrame, but
+    # st.download_button reads the whole file into memory to send it, so very big exports should use
+    # python review_store.py export
+    def export():
+        file = tempfile.TemporaryFile()
+        store.export_reviews(file, file_format="csv")
+        file.seek(0)
+        return file
+
+    st.download_button("Download all reviews (CSV)", export, file_name="reviews.csv", mime="text/csv",
+                       on_click="ignore")
+
+
+# definition for the hidden admin page with the timings, counters and memory of the portal
+def admin_page():
+    st.title("Admin")
+    if not metrics.enabled:
+        st.warning("Metrics are turned off, start the portal with PUZZLE_PORTAL_METRICS=1 to collect them.")
+
+    st.subheader("Timings of pages and sections")
+    timings = metrics.timing_table()
+    if timings.empty:
+        st.write("Nothing measured yet.")
+    else:
+        st.dataframe(timings, hide_index=True)
+
+    st.subheader("Counters")
+    st.dataframe(pd.DataFrame(sorted(metrics.counters.items()), columns=["name", "count"]), hide_index=True)
+
+    # the memory of this session is measured right now, the other sessions when they last reran
+    st.subheader("Session memory")
+    sizes = {str(key): deep_size(value) for key, value in st.session_state.to_dict().items()}
+    st.write(f"This session: {sum(sizes.values()) / 1024:.1f} KB in {len(sizes)} entries, "
+             f"{len(metrics.sessions)} sessions measured in total")
+    st.dataframe(pd.DataFrame(sorted(sizes.items(), key=lambda entry: -entry[1]), columns=["key", "bytes"]),
+                 hide_index=True)
+
+    # the admin page shows every cache, so they are all loaded here
+    st.subheader("Caches")
+    get_catalog()
+    get_similarity_job()
+    gauges = cache_gauges()
+    st.json(gauges)
+
+    st.download_button("Download metrics (Prometheus)", metrics.export(gauges), file_name="metrics.prom")
+    if metrics.enabled:
+        st.caption(f"The metrics are also written to {metrics.path} every few seconds.")
+
+    review_transfer(get_review_store())
+
+
+# page selection: when the user selects a page, only the function of that page runs
+PAGES = {
+    "Welcome To PuzzlePortal": welcome_page,
+    "Find Your Puzzle!": preference_page,
+    "Reviews": review_page,
+    "Get Inspired!": inspiration_page,
+    "My Puzzle Journey": journey_page,
+    "Admin": admin_page,
+}
+metrics.increment(f"page_view:{page_selection}")
+with metrics.timed("page", page_selection):
+    PAGES[page_selection]()
+
+# remember the memory of this session and update the metrics file, only if the metrics are turned on
+if metrics.enabled:
+    context = get_script_run_ctx()
+    metrics.record_session(context.session_id if context else "bare", st.session_state.to_dict())
+    metrics.write(cache_gauges)
@@ -0,0 +1,142 @@
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import fuzzy_matching
+from puzzle_matching import ATTRIBUTES, PuzzleMatcher
+
+# words of a puzzle name or attribute, e.g. "Zauberhafte Wüste 15069" -> zauberhafte, wuste, 15069
+WORD = re.compile(r"\w+")
+
+# words of the index that are at least this similar to a word of the query count as a match, so "leuchturm" still
+# finds "leuchtturm"
+TOKEN_CUTOFF = 75
+
+# n-grams of this length are used to find the words that are worth comparing fuzzily
+GRAM_SIZE = 3
+
+# number of recent queries whose results are kept, the search box is searched again on every rerun
+QUERY_CACHE_SIZE = 1000
+
+
+# accents that are left over when letters like "ü" are split into "u" and the accent
+ACCENTS = re.compile("[\u0300-\u036f]")
+
+
+# lower case without accents, so "Pokemon" finds "Pokémon" and "Wuste" finds "Wüste"
+def fold(text):
+    return ACCENTS.sub("", unicodedata.normalize("NFKD", str(text).lower()))
+
+
+# all words of a text, folded
+def tokenize(text):
+    return WORD.findall(fold(text))
+
+
+# the n-grams of a word, with spaces around it so short words and the start and end of a word have n-grams too
+def grams(token):
+    padded = f" {token} "
+    return {padded[start:start + GRAM_SIZE] for start in range(max(len(padded) - GRAM_SIZE + 1, 1))}
+
+
+# search index over the names and attributes of all puzzles, built once when the catalog is loaded:
+# word -> rows of the puzzles with that word, and n-gram -> words with that n-gram
+# a query only compares its words with the words that share n-grams with them, never with every puzzle
+class SearchIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.size = len(catalog)
+
+        # (word, row) pairs of the names, one row per name
+        names = catalog.frame["name"].str.lower().str.normalize("NFKD").str.replace(ACCENTS, "", regex=True)
+        words = names.str.findall(WORD).explode().dropna()
+        token_parts = [words.to_numpy(dtype=object)]
+        row_parts = [words.index.to_numpy(dtype=np.intp)]
+
+        # and of the attributes, only the distinct values have to be split into words
+        for key in ATTRIBUTES:
+            for value, rows in catalog.by_attribute[key].items():
+                for token in tokenize(value):
+                    token_parts.append(np.full(len(rows), token, dtype=object))
+                    row_parts.append(np.asarray(rows, dtype=np.intp))
+
+        # the rows of every word are stored one after the other in one array, sorted and without duplicates, the
+        # rows of word number i are row_data[offsets[i]:offsets[i + 1]]
+        ids, uniques = pd.factorize(np.concatenate(token_parts))
+        rows = np.concatenate(row_parts)
+        order = np.lexsort((rows, ids))
+        ids, rows = ids[order], rows[order]
+        keep = np.ones(len(ids), dtype=bool)
+        keep[1:] = (ids[1:] != ids[:-1]) | (rows[1:] != rows[:-1])
+        self.tokens = list(uniques)
+        self.token_ids = {token: number for number, token in enumerate(self.tokens)}
+        self.row_data = rows[keep]
+        self.offsets = np.searchsorted(ids[keep], np.arange(len(self.tokens) + 1))
+
+        # n-gram -> ids of the words with that n-gram
+        self.grams = {}
+        for number, token in enumerate(self.tokens):
+            # numbers are only found exactly, an item number with a typo is another item number
+            if not token.isdigit():
+                for gram in grams(token):
+                    self.grams.setdefault(gram, []).append(number)
+
+        self._results = {}
+        self._lock = threading.Lock()
+
+    # rows of the puzzles with a word of the index
+    def rows(self, number):
+        return self.row_data[self.offsets[number]:self.offsets[number + 1]]
+
+    # ids and similarities of the words in the index that are similar enough to a word of the query
+    def similar_tokens(self, token):
+        exact = self.token_ids.get(token)
+        if token.isdigit():
+            return [] if exact is None else [(exact, 100.0)]
+
+        # only the words that share at least one n-gram with the query word are compared fuzzily
+        candidates = set()
+        for gram in grams(token):
+            candidates.update(self.grams.get(gram, ()))
+        choices = {number: self.tokens[number] for number in candidates}
+        return [(number, score) for _, score, number in fuzzy_matching.extract(token, choices, cutoff=TOKEN_CUTOFF)]
+
+    # relevance of every puzzle for a query: for every word of the query the similarity of the best matching word
+    # of the puzzle, averaged over the words of the query
+    def scores(self, query):
+        tokens = tokenize(query)
+        scores = np.zeros(self.size, dtype=np.float64)
+        for token in tokens:
+            best = np.zeros(self.size, dtype=np.float64)
+            for number, similarity in self.similar_tokens(token):
+                rows = self.rows(number)
+                best[rows] = np.maximum(best[rows], similarity)
+            scores += best
+        return scores / max(len(tokens), 1)
+
+    # rows and scores of the best puzzles for a query, best first
+    # a complete item number finds its puzzle right away, which is always the first result
+    def search(self, query, limit=10):
+        key = (" ".join(tokenize(query)), limit)
+        results = self._results.get(key)
+        if results is not None:
+            return results
+
+        results = []
+        exact = self.catalog.find(query)
+        if exact is not None:
+            results.append((exact, 100.0))
+        scores = self.scores(query)
+        if exact is not None:
+            scores[exact] = 0
+        results += [(int(row), float(scores[row])) for row in PuzzleMatcher._best_rows(scores, limit - len(results))
+                    if scores[row] > 0]
+
+        with self._lock:
+            if len(self._results) >= QUERY_CACHE_SIZE:
+                self._results.clear()
+            self._results[key] = results
+        return results
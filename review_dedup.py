@@ -0,0 +1,244 @@
+import re
+import threading
+from collections import deque
+
+import numpy as np
+
+import fuzzy_matching
+
+# comments are compared without case, punctuation and repeated spaces
+PUNCTUATION = re.compile(r"[^\w\s]+")
+SPACES = re.compile(r"\s+")
+
+# a comment is split into overlapping pieces of this many characters (shingles) for the MinHash signature
+SHINGLE_SIZE = 4
+
+# the signature has BANDS * ROWS values, two comments end up in the same bucket if all values of one band are the
+# same, which is very likely for comments that are almost the same and unlikely for different ones
+BANDS = 8
+ROWS = 4
+
+# comments that are at least this similar (fuzzy_matching.ratio) to an earlier one of the same item are duplicates
+DUPLICATE_CUTOFF = 90
+
+# short comments like "Great puzzle!" are written by many people, so they are only duplicates if the same person
+# writes them again
+MIN_SPAM_LENGTH = 30
+
+# number of recent reviews per item that new reviews are compared with, and of all items together, so the memory of
+# the detector stays the same however many reviews are written (about 2 KB per review, 100 MB in total)
+RECENT_PER_ITEM = 10_000
+MAX_REVIEWS = 50_000
+
+# a review that the same person already wrote for the item is a duplicate and is not saved, one that is very similar
+# to the review of somebody else is saved but flagged as possible spam
+DUPLICATE = "duplicate"
+FLAGGED = "flagged"
+
+# the random numbers of the hash functions of the signature, and of the hash that combines the rows of a band into
+# one bucket number, different for every band so the buckets of different bands never mix
+_rng = np.random.default_rng(2024)
+_MULTIPLIERS = _rng.integers(1, 2**63, size=BANDS * ROWS, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _rng.integers(0, 2**63, size=BANDS * ROWS, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2**63, size=(BANDS, ROWS), dtype=np.uint64) | np.uint64(1)
+_CHARACTER_MIX = np.uint64(0x100000001B3)
+_BIT_MIX = np.uint64(0xBF58476D1CE4E5B9)
+
+# number of comments whose signatures are computed in one numpy operation
+SIGNATURE_BATCH = 100
+
+
+# lower case without punctuation and repeated spaces
+def normalize(comment):
+    return SPACES.sub(" ", PUNCTUATION.sub(" ", str(comment).lower())).strip()
+
+
+# MinHash signatures of many normalized comments at once, one row per comment: for every hash function the smallest
+# hash of all shingles of the comment
+# the comments are joined into one array of character codes, so the shingles of all of them are hashed by numpy
+# instead of one by one, comments shorter than a shingle are padded with zeros to make one shingle
+def signatures(texts):
+    texts = [text.ljust(SHINGLE_SIZE, "\0") for text in texts]
+    lengths = np.fromiter(map(len, texts), dtype=np.intp, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    counts = lengths - SHINGLE_SIZE + 1
+    # the first character of every shingle, shingles never run into the next comment
+    starts = np.repeat(np.cumsum(lengths) - lengths, counts)
+    starts += np.arange(len(starts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # the multiplications overflow on purpose, that is the hash function
+    with np.errstate(over="ignore"):
+        hashes = np.zeros(len(starts), dtype=np.uint64)
+        for offset in range(SHINGLE_SIZE):
+            hashes = hashes * _CHARACTER_MIX + codes[starts + offset]
+        # mix the bits (as in splitmix64), so shingles that only differ in the last character get unrelated hashes
+        hashes ^= hashes >> np.uint64(31)
+        hashes *= _BIT_MIX
+        hashes ^= hashes >> np.uint64(29)
+        # a single comment (a review written on the page) takes all hash functions at once, many comments one hash
+        # function at a time, because np.minimum.reduceat over the rows of a (shingles, BANDS * ROWS) array is slow
+        if len(texts) == 1:
+            return (hashes[:, None] * _MULTIPLIERS + _OFFSETS).min(axis=0, keepdims=True)
+        firsts = np.cumsum(counts) - counts
+        values = np.empty((len(texts), BANDS * ROWS), dtype=np.uint64)
+        scratch = np.empty_like(hashes)
+        for function in range(BANDS * ROWS):
+            np.multiply(hashes, _MULTIPLIERS[function], out=scratch)
+            scratch += _OFFSETS[function]
+            values[:, function] = np.minimum.reduceat(scratch, firsts)
+    return values
+
+
+# the buckets of all bands of many normalized comments, a tuple of BANDS bucket numbers per comment
+def bucket_keys(texts):
+    keys = []
+    for start in range(0, len(texts), SIGNATURE_BATCH):
+        values = signatures(texts[start:start + SIGNATURE_BATCH]).reshape(-1, BANDS, ROWS)
+        with np.errstate(over="ignore"):
+            keys += map(tuple, (values * _BAND_MIX).sum(axis=2).tolist())
+    return keys
+
+
+# the buckets of one normalized comment
+def buckets(text):
+    return bucket_keys([text])[0]
+
+
+# finds reviews that are (almost) the same as an earlier review of the same item: a new comment is only compared
+# fuzzily to the earlier comments that share a MinHash bucket with it, not to every comment of the item
+# at most max_reviews reviews are remembered in total and recent_per_item per item, the oldest are forgotten first
+class DuplicateDetector:
+    def __init__(self, recent_per_item=RECENT_PER_ITEM, max_reviews=MAX_REVIEWS):
+        self.recent_per_item = recent_per_item
+        self.max_reviews = max_reviews
+        self.checks = 0
+        self.comparisons = 0
+        # item number -> recent reviews as (number, buckets), oldest first
+        self._recent = {}
+        # item number -> bucket -> numbers of the reviews in that bucket, most buckets only hold one review, so
+        # lists need less memory than sets
+        self._buckets = {}
+        # number -> (name, normalized comment) of every remembered review
+        self._reviews = {}
+        # (item number, number) of every remembered review, oldest first, for the total limit
+        self._order = deque()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    # the most similar earlier review of the item as (name, comment, similarity), or None, reviews of the same
+    # person come first
+    def _find(self, item_number, name, text, keys):
+        item_buckets = self._buckets.get(item_number, {})
+        candidates = set()
+        for key in keys:
+            candidates.update(item_buckets.get(key, ()))
+        self.checks += 1
+        self.comparisons += len(candidates)
+
+        best = None
+        for number in candidates:
+            other_name, other_text = self._reviews[number]
+            # somebody else writing a short comment like "Great puzzle" is not a duplicate
+            if other_name != name and len(text) < MIN_SPAM_LENGTH:
+                continue
+            similarity = fuzzy_matching.ratio(text, other_text)
+            if similarity >= DUPLICATE_CUTOFF and (best is None or (other_name == name, similarity)
+                                                   > (best[0] == name, best[2])):
+                best = (other_name, other_text, similarity)
+        return best
+
+    # remember a review so later reviews are compared with it
+    def add(self, item_number, name, comment):
+        self.add_many([item_number], [name], [comment])
+
+    # remember many reviews at once, e.g. the recent reviews when the store is opened
+    def add_many(self, item_numbers, names, comments):
+        texts = [normalize(comment) for comment in comments]
+        keys = bucket_keys(texts)
+        with self._lock:
+            for item_number, name, text, text_keys in zip(item_numbers, names, texts, keys):
+                self._add(item_number, name, text, text_keys)
+
+    def _add(self, item_number, name, text, keys):
+        self._count += 1
+        number = self._count
+        recent = self._recent.setdefault(item_number, deque())
+        item_buckets = self._buckets.setdefault(item_number, {})
+        recent.append((number, keys))
+        self._reviews[number] = (name, text)
+        self._order.append((item_number, number))
+        for key in keys:
+            item_buckets.setdefault(key, []).append(number)
+
+        # forget the oldest review of the item when there are too many, and the oldest of all
+        if len(recent) > self.recent_per_item:
+            self._forget(item_number)
+        while len(self._reviews) > self.max_reviews:
+            old_item, old = self._order.popleft()
+            # it may already be forgotten because its item had too many reviews
+            if old in self._reviews:
+                self._forget(old_item)
+        # reviews forgotten through the limit per item (or taken back) stay in the order until they are dropped
+        # here, at twice the limit so this happens rarely and the order never holds more than 2 * max_reviews
+        if len(self._order) > 2 * self.max_reviews:
+            self._order = deque(entry for entry in self._order if entry[1] in self._reviews)
+
+    # forget a remembered review of an item, the oldest one unless another position in its recent reviews is given
+    def _forget(self, item_number, position=0):
+        recent = self._recent[item_number]
+        item_buckets = self._buckets[item_number]
+        old, old_keys = recent[position]
+        del recent[position]
+        del self._reviews[old]
+        for key in old_keys:
+            item_buckets[key].remove(old)
+            if not item_buckets[key]:
+                del item_buckets[key]
+        if not recent:
+            del self._recent[item_number]
+            del self._buckets[item_number]
+
+    def _check(self, item_number, name, text, keys):
+        match = self._find(item_number, name, text, keys)
+        if match is not None and match[0] == name:
+            return DUPLICATE, match
+        self._add(item_number, name, text, keys)
+        return (None if match is None else FLAGGED), match
+
+    # check a new review and remember it in one step, so two sessions saving the same review at the same time
+    # cannot both pass, returns DUPLICATE, FLAGGED or None and the earlier review as (name, comment, similarity)
+    # duplicates are not remembered, because they are not saved
+    def check(self, item_number, name, comment):
+        return self.check_many([item_number], [name], [comment])[0]
+
+    # check many reviews in order, e.g. a chunk of an import, later reviews are also compared with earlier ones of
+    # the same call, returns a list of (verdict, match)
+    def check_many(self, item_numbers, names, comments):
+        texts = [normalize(comment) for comment in comments]
+        keys = bucket_keys(texts)
+        with self._lock:
+            return [self._check(item_number, name, text, text_keys)
+                    for item_number, name, text, text_keys in zip(item_numbers, names, texts, keys)]
+
+    # take back reviews that passed the check but could not be saved, so saving them again is not a duplicate
+    def forget(self, item_number, name, comment):
+        self.forget_many([item_number], [name], [comment])
+
+    # take back many reviews at once, e.g. a chunk of an import, the newest remembered review with the same item,
+    # name and comment is forgotten for each of them
+    def forget_many(self, item_numbers, names, comments):
+        with self._lock:
+            for item_number, name, comment in zip(item_numbers, names, comments):
+                review = (name, normalize(comment))
+                recent = self._recent.get(item_number, ())
+                for position in range(len(recent) - 1, -1, -1):
+                    if self._reviews[recent[position][0]] == review:
+                        self._forget(item_number, position)
+                        break
+
+    # number of checks, remembered reviews and fuzzy comparisons per check
+    def report(self):
+        return {
+            "checks": self.checks,
+            "remembered": len(self._reviews),
+            "comparisons_per_check": self.comparisons / self.checks if self.checks else 0.0,
+        }
@@ -0,0 +1,280 @@
+import sqlite3
+import threading
+import time
+from array import array
+
+import numpy as np
+
+# number of most similar puzzles kept for every puzzle, a recommendation only looks at these
+NEIGHBOURS = 50
+
+# only the most recent reviews of every person are used, so one person with thousands of reviews does not make the
+# number of puzzle pairs explode
+MAX_REVIEWS_PER_PERSON = 200
+
+# two puzzles are only similar if at least this many people reviewed both of them
+MIN_COMMON = 2
+
+# number of puzzle pairs that are summed up at once while the similarities are built, more is a bit faster but needs
+# more memory
+PAIRS_PER_BLOCK = 1_000_000
+
+# reviews with at least this many stars are puzzles the person liked
+LIKED_STARS = 4
+
+# the job looks for new reviews this often, in seconds
+REFRESH_INTERVAL = 60
+
+# how much the puzzles that people like you liked move up: a puzzle that is as similar as possible to the ones you
+# liked gets this share of the way from its match score to 100%
+COLLABORATIVE_SHARE = 0.3
+
+
+# which puzzles were liked by the same people, computed once from all reviews: every review is an entry
+# (person, puzzle, stars) of a sparse person x puzzle matrix, the stars are centered on the average stars of the
+# person, and the similarity of two puzzles is the cosine of their columns (adjusted cosine)
+# the matrix is stored as plain numpy arrays, the product of the matrix with itself is computed from the pairs of
+# puzzles that one person reviewed, and only the NEIGHBOURS most similar puzzles of every puzzle are kept
+class ItemSimilarity:
+    # people and items are the person code and puzzle code of every review, oldest first, item_numbers is the item
+    # number of every puzzle code and person_codes maps a name to its person code
+    def __init__(self, people, items, stars, item_numbers, person_codes, neighbours=NEIGHBOURS,
+                 min_common=MIN_COMMON):
+        start = time.perf_counter()
+        people = np.asarray(people, dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        stars = np.asarray(stars, dtype=np.float64)
+        self.item_numbers = np.asarray(item_numbers, dtype=object)
+        self.item_codes = {item_number: code for code, item_number in enumerate(self.item_numbers)}
+        self.person_codes = person_codes
+        self.reviews = len(stars)
+        item_count = len(self.item_numbers)
+        person_count = int(people.max()) + 1 if len(people) else 0
+
+        # only the last review of a person for a puzzle counts, then the most recent reviews of every person
+        key = people * item_count + items
+        _, last = np.unique(key[::-1], return_index=True)
+        latest = len(key) - 1 - last
+        latest = latest[np.lexsort((-latest, people[latest]))]
+        people, items, stars = people[latest], items[latest], stars[latest]
+        first = np.searchsorted(people, np.arange(person_count + 1))
+        keep = np.arange(len(people)) - first[people] < MAX_REVIEWS_PER_PERSON
+        people, items, stars = people[keep], items[keep], stars[keep]
+
+        # the puzzles every person liked, the rows of person p are liked[liked_offsets[p]:liked_offsets[p + 1]]
+        liked = stars >= LIKED_STARS
+        self.liked = items[liked]
+        self.liked_offsets = np.searchsorted(people[liked], np.arange(person_count + 1))
+
+        # center the stars on the average of the person, so people who give everything five stars count as much as
+        # strict ones, a person with one review (or only equal stars) says nothing about similarity and is dropped
+        counts = np.bincount(people, minlength=person_count)
+        averages = np.bincount(people, weights=stars, minlength=person_count) / np.maximum(counts, 1)
+        values = stars - averages[people]
+        keep = values != 0
+        people, items, values = people[keep], items[keep], values[keep]
+        norms = np.sqrt(np.bincount(items, weights=values ** 2, minlength=item_count))
+
+        # the pairs of puzzles that one person reviewed are built for a block of puzzles at a time, which holds all
+        # pairs of those puzzles, so only the neighbours of a block have to be kept and never all pairs at once
+        first = np.searchsorted(people, np.arange(person_count + 1))
+        pair_counts = np.cumsum(np.bincount(items, weights=np.diff(first)[people] - 1, minlength=item_count))
+        total = pair_counts[-1] if item_count else 0
+        bounds = np.unique(np.concatenate(([0], np.searchsorted(pair_counts, np.arange(PAIRS_PER_BLOCK, total,
+                                                                                        PAIRS_PER_BLOCK)),
+                                           [item_count])))
+        self.pairs = 0
+        blocks = [self._neighbours(np.flatnonzero((items >= low) & (items < high)), people, items, values, norms,
+                                   first, neighbours, min_common) for low, high in zip(bounds[:-1], bounds[1:])]
+
+        # the blocks are in the order of the puzzles, so the most similar puzzles of puzzle i are
+        # neighbour_items[offsets[i]:offsets[i + 1]], most similar first
+        owners = np.concatenate([block[0] for block in blocks] + [np.empty(0, dtype=np.int64)])
+        self.neighbour_items = np.concatenate([block[1] for block in blocks] + [np.empty(0, dtype=np.int64)])
+        self.neighbour_similarities = np.concatenate([block[2] for block in blocks] + [np.empty(0)])
+        self.offsets = np.searchsorted(owners, np.arange(item_count + 1))
+        self.build_seconds = time.perf_counter() - start
+
+    # the most similar puzzles of the puzzles of some entries: every entry is paired with the other entries of its
+    # person, the products of every pair of puzzles are summed up, which is the product of the matrix with itself,
+    # returns the puzzles, their neighbours and the similarities, sorted by puzzle and most similar first
+    def _neighbours(self, entries, people, items, values, norms, first, neighbours, min_common):
+        sizes = np.diff(first)[people[entries]]
+        left = np.repeat(entries, sizes)
+        starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+        right = first[people[left]] + np.arange(len(left)) - starts
+        pair = left != right
+        left, right = left[pair], right[pair]
+        self.pairs += len(left)
+
+        item_count = len(norms)
+        pair_keys, inverse = np.unique(items[left] * item_count + items[right], return_inverse=True)
+        dots = np.bincount(inverse, weights=values[left] * values[right], minlength=len(pair_keys))
+        common = np.bincount(inverse, minlength=len(pair_keys))
+        first_items, second_items = pair_keys // item_count, pair_keys % item_count
+        similarities = dots / (norms[first_items] * norms[second_items])
+        similar = (common >= min_common) & (similarities > 0)
+        first_items, second_items, similarities = first_items[similar], second_items[similar], similarities[similar]
+
+        order = np.lexsort((-similarities, first_items))
+        first_items, second_items, similarities = first_items[order], second_items[order], similarities[order]
+        group = np.searchsorted(first_items, first_items, side="left")
+        keep = np.arange(len(first_items)) - group < neighbours
+        return first_items[keep], second_items[keep], similarities[keep]
+
+    # build it straight from lists of item numbers, names and stars, e.g. for the benchmark
+    @classmethod
+    def from_reviews(cls, item_numbers, names, stars, **options):
+        person_codes, item_codes = {}, {}
+        people = [person_codes.setdefault(name, len(person_codes)) for name in names]
+        items = [item_codes.setdefault(str(item_number), len(item_codes)) for item_number in item_numbers]
+        return cls(people, items, stars, list(item_codes), person_codes, **options)
+
+    # item numbers of the puzzles a person liked, empty for unknown names
+    def liked_by(self, name):
+        person = self.person_codes.get(name)
+        if person is None or person + 1 >= len(self.liked_offsets):
+            return []
+        return list(self.item_numbers[self.liked[self.liked_offsets[person]:self.liked_offsets[person + 1]]])
+
+    # item numbers and similarities of the most similar puzzles of one puzzle, most similar first
+    def neighbours(self, item_number):
+        code = self.item_codes.get(str(item_number))
+        if code is None:
+            return [], []
+        found = slice(self.offsets[code], self.offsets[code + 1])
+        return list(self.item_numbers[self.neighbour_items[found]]), self.neighbour_similarities[found].tolist()
+
+    # how much the people who liked the seed puzzles also liked other puzzles: seeds is a dict item number -> weight,
+    # the score of a puzzle is the weighted average of its similarity to the seeds (0 to 1)
+    # returns a dict item number -> score, without the puzzles in exclude
+    def scores(self, seeds, exclude=()):
+        codes, weights = [], []
+        for item_number, weight in seeds.items():
+            code = self.item_codes.get(str(item_number))
+            if code is not None and weight > 0:
+                found = slice(self.offsets[code], self.offsets[code + 1])
+                codes.append(self.neighbour_items[found])
+                weights.append(weight * self.neighbour_similarities[found])
+        total_weight = sum(weight for weight in seeds.values() if weight > 0)
+        if not codes or total_weight == 0:
+            return {}
+        found, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(weights)) / total_weight
+        excluded = {str(item_number) for item_number in exclude}
+        return {item_number: float(total) for item_number, total in zip(self.item_numbers[found], totals)
+                if item_number not in excluded}
+
+    # number of reviews, puzzles and kept neighbours and how long the build took
+    def report(self):
+        return {
+            "reviews": self.reviews,
+            "puzzles": len(self.item_numbers),
+            "pairs": self.pairs,
+            "neighbours": len(self.neighbour_items),
+            "build_ms": self.build_seconds * 1000,
+        }
+
+
+# background job that keeps the item similarities up to date: it only reads the reviews that are new since its
+# last run, and builds a new ItemSimilarity when there are any, the sessions keep using the old one until the new
+# one is ready, so a recommendation never waits for the build
+class SimilarityJob:
+    def __init__(self, store, interval=REFRESH_INTERVAL, start=True):
+        self.store = store
+        self.interval = interval
+        self.similarity = None
+        self.builds = 0
+        self.errors = 0
+        self._last_id = 0
+        self._person_codes = {}
+        self._item_codes = {}
+        # codes and stars of all reviews read so far, as compact arrays instead of lists of Python ints
+        self._people = array("i")
+        self._items = array("i")
+        self._stars = array("b")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if start:
+            threading.Thread(target=self._run, name="item-similarity", daemon=True).start()
+
+    # read the new reviews and build the similarities again if there were any, returns True if it built them
+    def refresh(self):
+        with self._lock:
+            new = False
+            while True:
+                rows = self.store.stars_since(self._last_id)
+                if not rows:
+                    break
+                new = True
+                self._last_id = rows[-1][0]
+                for _, item_number, name, stars in rows:
+                    self._people.append(self._person_codes.setdefault(name, len(self._person_codes)))
+                    self._items.append(self._item_codes.setdefault(item_number, len(self._item_codes)))
+                    self._stars.append(stars)
+            if not new and self.similarity is not None:
+                return False
+            # a copy of the names, the job keeps adding names while the sessions look them up
+            self.similarity = ItemSimilarity(self._people, self._items, self._stars, list(self._item_codes),
+                                             dict(self._person_codes))
+            self.builds += 1
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                # e.g. the database is locked for a long import, the next run tries again
+                self.errors += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def close(self):
+        self._stop.set()
+
+    # number of builds and the numbers of the current similarities
+    def report(self):
+        report = {"builds": self.builds, "errors": self.errors}
+        if self.similarity is not None:
+            report.update(self.similarity.report())
+        return report
+
+
+# the recommendations of the preference page with the puzzles that people like you liked moved up: the seeds are the
+# puzzles the person (name) rated with LIKED_STARS or more, or the attribute matches if there are none, and every
+# puzzle gets COLLABORATIVE_SHARE * similarity of the way from its match score to 100%
+# only the attribute matches and the neighbours of the seeds can end up in the top k, so those are the only puzzles
+# that are scored, returns (row, score, breakdown, similarity) of the k best puzzles
+def blend(catalog, similarity, user_preferences, weights=None, k=5, threshold=0, name=None,
+          share=COLLABORATIVE_SHARE):
+    ranking = catalog.recommendations.rank(user_preferences, k=k, threshold=threshold, weights=weights)
+    if similarity is None:
+        return [(row, score, breakdown, 0.0) for row, score, breakdown in ranking]
+
+    liked = similarity.liked_by(name) if name else []
+    if liked:
+        seeds = dict.fromkeys(liked, 1.0)
+    else:
+        seeds = {catalog.puzzle(row)["item_number"]: score / 100 for row, score, _ in ranking}
+    collaborative = similarity.scores(seeds, exclude=liked)
+    if not collaborative:
+        return [(row, score, breakdown, 0.0) for row, score, breakdown in ranking]
+
+    # match scores of the neighbours, the attribute matches already have theirs
+    item_numbers = catalog.frame["item_number"]
+    candidates = {row: (score, breakdown) for row, score, breakdown in ranking}
+    new = [int(row) for row in catalog.rows_for(list(collaborative)) if row >= 0 and row not in candidates]
+    for row, score in zip(new, catalog.matcher.scores_of(new, user_preferences, weights)):
+        candidates[row] = (float(score), None)
+
+    blended = []
+    for row, (score, breakdown) in candidates.items():
+        liked_share = collaborative.get(item_numbers.iat[row], 0.0)
+        score += share * (100 - score) * liked_share
+        if score >= threshold and score > 0:
+            blended.append((row, score, breakdown, liked_share))
+    blended.sort(key=lambda match: (-match[1], match[0]))
+    # only the puzzles that are shown need a breakdown
+    return [(row, score, catalog.matcher.breakdown(row, user_preferences) if breakdown is None else breakdown,
+             liked_share) for row, score, breakdown, liked_share in blended[:k]]
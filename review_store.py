@@ -0,0 +1,508 @@
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from review_dedup import DUPLICATE, FLAGGED, MAX_REVIEWS, DuplicateDetector
+
+# the database file with all reviews, can be moved with the PUZZLE_PORTAL_REVIEWS environment variable
+REVIEWS_PATH = os.environ.get("PUZZLE_PORTAL_REVIEWS",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "reviews.db"))
+
+# column names in the database and the names that are shown on the review page
+COLUMNS = {
+    "item_number": "Item Number",
+    "name": "Name",
+    "stars": "Stars",
+    "comment": "Comment",
+    "created_at": "Date",
+}
+
+# the summary also counts the reviews with every number of stars, stars_1 to stars_5
+STARS = range(1, 6)
+HISTOGRAM = [f"stars_{stars}" for stars in STARS]
+SUMMARY_COLUMNS = ["item_number", "review_count", "star_total"] + HISTOGRAM
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    item_number TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stars INTEGER NOT NULL,
+    comment TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    flagged INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS reviews_item_number ON reviews (item_number);
+CREATE INDEX IF NOT EXISTS reviews_stars ON reviews (stars, id);
+CREATE TABLE IF NOT EXISTS item_summary (
+    item_number TEXT PRIMARY KEY,
+    review_count INTEGER NOT NULL,
+    star_total INTEGER NOT NULL,
+    {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in HISTOGRAM)}
+);
+"""
+
+INSERT_REVIEW = ("INSERT INTO reviews (item_number, name, stars, comment, created_at, flagged) "
+                 "VALUES (?, ?, ?, ?, ?, ?)")
+
+# the summary of an item is updated in the same transaction as the review is saved
+UPDATE_SUMMARY = f"""
+INSERT INTO item_summary ({", ".join(SUMMARY_COLUMNS)}) VALUES ({", ".join("?" * len(SUMMARY_COLUMNS))})
+ON CONFLICT (item_number) DO UPDATE SET {", ".join(f"{column} = {column} + excluded.{column}"
+                                                   for column in SUMMARY_COLUMNS[1:])}
+"""
+
+# the summaries computed from the reviews themselves, to rebuild or check the summary table
+COMPUTE_SUMMARIES = f"""
+SELECT item_number, COUNT(*), SUM(stars), {", ".join(f"SUM(stars = {stars})" for stars in STARS)}
+FROM reviews GROUP BY item_number
+"""
+
+# the best rated items, items with the same average are sorted by their number of reviews
+TOP_RATED = f"""
+SELECT item_number, review_count, CAST(star_total AS REAL) / review_count AS average, {", ".join(HISTOGRAM)}
+FROM item_summary WHERE review_count >= ? ORDER BY average DESC, review_count DESC, item_number LIMIT ?
+"""
+
+# number of the most recent reviews the duplicate check knows when the store is opened, as many as it remembers
+DUPLICATE_PRELOAD = MAX_REVIEWS
+
+# bulk imports and exports read and write this many reviews at a time, so memory does not grow with the file size
+CHUNK_SIZE = 50_000
+
+# number of rejected rows of an import that are reported with the reason
+REPORTED_ERRORS = 20
+
+# columns the review browser can sort by, the id keeps the order of reviews with the same value stable
+SORT_COLUMNS = {"Date": "id", "Stars": "stars"}
+
+
+# raised by add_review when the same person already wrote (almost) the same review for the item
+class DuplicateReview(ValueError):
+    def __init__(self, match):
+        super().__init__(f"{match[0]} already wrote this review: {match[1]!r}")
+        self.match = match
+
+
+# review storage shared by all sessions: an SQLite database in WAL mode, so readers never wait for the writer,
+# and a single writer thread that collects the reviews of all sessions and saves them in batches
+class ReviewStore:
+    def __init__(self, path=None, batch_size=200):
+        self.path = path or REVIEWS_PATH
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._queue = queue.Queue()
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        # the upgrade of older databases holds the write lock, so several processes starting at once do not
+        # upgrade the same database twice
+        connection.execute("BEGIN IMMEDIATE")
+        # databases from before the star histogram get the columns added and the summaries computed again
+        existing = {row[1] for row in connection.execute("PRAGMA table_info(item_summary)")}
+        missing = [column for column in HISTOGRAM if column not in existing]
+        for column in missing:
+            connection.execute(f"ALTER TABLE item_summary ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        # and databases from before the duplicate check get the flag for possible spam
+        if "flagged" not in {row[1] for row in connection.execute("PRAGMA table_info(reviews)")}:
+            connection.execute("ALTER TABLE reviews ADD COLUMN flagged INTEGER NOT NULL DEFAULT 0")
+        # only the few flagged reviews are in this index, so counting them does not read the whole table
+        connection.execute("CREATE INDEX IF NOT EXISTS reviews_flagged ON reviews (id) WHERE flagged")
+        # as do databases from before the summaries existed
+        if missing or connection.execute("SELECT NOT EXISTS (SELECT 1 FROM item_summary) "
+                                         "AND EXISTS (SELECT 1 FROM reviews)").fetchone()[0]:
+            self._rebuild_summaries(connection)
+        connection.commit()
+
+        # new reviews are compared with the recent ones to find duplicates
+        self.duplicates = DuplicateDetector()
+        recent = connection.execute(
+            "SELECT item_number, name, comment FROM (SELECT id, item_number, name, comment FROM reviews "
+            "ORDER BY id DESC LIMIT ?) ORDER BY id", (DUPLICATE_PRELOAD,)).fetchall()
+        if recent:
+            self.duplicates.add_many(*zip(*recent))
+        connection.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="review-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # with WAL, NORMAL is still safe against corruption and saves an fsync per commit
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # every thread (Streamlit runs each session in its own thread) gets its own connection for reading
+    def _reader(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = self._connect()
+        return self._local.connection
+
+    # the writer thread: wait for the first review, take everything else that is waiting and save it at once
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                self._insert(connection, [row for row, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+        connection.close()
+
+    # save reviews and update the summaries of their items in one transaction
+    @staticmethod
+    def _insert(connection, rows):
+        # item number -> [count, star total, reviews with 1 star, ..., reviews with 5 stars]
+        summaries = {}
+        for item_number, _, stars, *_ in rows:
+            summary = summaries.setdefault(item_number, [0] * (2 + len(STARS)))
+            summary[0] += 1
+            summary[1] += stars
+            summary[1 + stars] += 1
+        with connection:
+            connection.executemany(INSERT_REVIEW, rows)
+            connection.executemany(UPDATE_SUMMARY, [(item_number, *summary) for item_number, summary
+                                                    in summaries.items()])
+
+    # save a review, waits until it is in the database unless wait is False
+    # a review the same person already wrote for the item raises DuplicateReview, one that is almost the same as the
+    # review of somebody else is saved with a flag, unless check_duplicates is False
+    def add_review(self, item_number, name, stars, comment, wait=True, check_duplicates=True):
+        created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        item_number = str(item_number).strip()
+        if int(stars) not in STARS:
+            raise ValueError(f"stars must be between 1 and 5, not {stars}")
+        flagged = 0
+        if check_duplicates:
+            verdict, match = self.duplicates.check(item_number, name, comment)
+            if verdict == DUPLICATE:
+                raise DuplicateReview(match)
+            flagged = int(verdict == FLAGGED)
+        future = Future()
+        if check_duplicates:
+            # a review that could not be saved is taken back, so it is not a duplicate when it is saved again
+            def take_back(done):
+                if done.exception() is not None:
+                    self.duplicates.forget(item_number, name, comment)
+            future.add_done_callback(take_back)
+        self._queue.put(((item_number, name, int(stars), comment, created_at, flagged), future))
+        if wait:
+            future.result(timeout=30)
+        return future
+
+    # WHERE clause and parameters for the filters of the review browser
+    @staticmethod
+    def _where(item_number=None, min_stars=1, max_stars=5, text=None):
+        conditions = []
+        parameters = []
+        if (min_stars, max_stars) != (1, 5):
+            conditions.append("stars BETWEEN ? AND ?")
+            parameters += [int(min_stars), int(max_stars)]
+        if item_number:
+            conditions.append("item_number = ?")
+            parameters.append(str(item_number).strip())
+        if text:
+            conditions.append("comment LIKE ? ESCAPE '\\'")
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            parameters.append(f"%{escaped}%")
+        if not conditions:
+            return "", parameters
+        return " WHERE " + " AND ".join(conditions), parameters
+
+    # number of saved reviews that match the filters
+    def count(self, item_number=None, min_stars=1, max_stars=5, text=None):
+        # without star or text filters the count comes from the summary table instead of counting reviews
+        if (min_stars, max_stars) == (1, 5) and not text:
+            if item_number:
+                return self.item_rating(item_number)[0]
+            return self._reader().execute("SELECT COALESCE(SUM(review_count), 0) FROM item_summary").fetchone()[0]
+        filters = dict(item_number=item_number, min_stars=min_stars, max_stars=max_stars, text=text)
+        where, parameters = self._where(**filters)
+        return self._reader().execute("SELECT COUNT(*) FROM reviews" + where, parameters).fetchone()[0]
+
+    # one page of the reviews that match the filters as a DataFrame, newest first unless sorted otherwise,
+    # only this page is read from the database
+    def read_reviews(self, offset=0, limit=20, sort="Date", descending=True, **filters):
+        where, parameters = self._where(**filters)
+        order = "DESC" if descending else "ASC"
+        sql = (f"SELECT item_number, name, stars, comment, created_at FROM reviews{where} "
+               f"ORDER BY {SORT_COLUMNS[sort]} {order}, id {order} LIMIT ? OFFSET ?")
+        rows = self._reader().execute(sql, parameters + [limit, offset]).fetchall()
+        return pd.DataFrame(rows, columns=list(COLUMNS.values()))
+
+    # number of reviews and average stars of an item from the summary table, without reading its reviews
+    def item_rating(self, item_number):
+        row = self._reader().execute("SELECT review_count, star_total FROM item_summary WHERE item_number = ?",
+                                     (str(item_number).strip(),)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], row[1] / row[0]
+
+    # number of reviews that were saved with a flag because they are almost the same as another review, the
+    # condition must stay "WHERE flagged" so SQLite counts the rows of the reviews_flagged index
+    def flagged_count(self):
+        return self._reader().execute("SELECT COUNT(*) FROM reviews WHERE flagged").fetchone()[0]
+
+    # number of reviews and average stars of many items at once, e.g. of all recommended puzzles,
+    # item number -> (count, average), items without reviews are left out
+    def ratings(self, item_numbers):
+        item_numbers = [str(item_number).strip() for item_number in item_numbers]
+        if not item_numbers:
+            return {}
+        rows = self._reader().execute(
+            f"SELECT item_number, review_count, star_total FROM item_summary WHERE item_number IN "
+            f"({', '.join('?' * len(item_numbers))})", item_numbers).fetchall()
+        return {item_number: (count, total / count) for item_number, count, total in rows}
+
+    # number of reviews of an item with 1, 2, 3, 4 and 5 stars
+    def histogram(self, item_number):
+        row = self._reader().execute(f"SELECT {', '.join(HISTOGRAM)} FROM item_summary WHERE item_number = ?",
+                                     (str(item_number).strip(),)).fetchone()
+        return list(row) if row else [0] * len(HISTOGRAM)
+
+    # the best rated items with at least min_reviews reviews as a DataFrame, straight from the summary table
+    def top_rated(self, limit=10, min_reviews=1):
+        rows = self._reader().execute(TOP_RATED, (min_reviews, limit)).fetchall()
+        frame = pd.DataFrame(rows, columns=["Item Number", "Reviews", "Average"] + HISTOGRAM)
+        frame["Histogram"] = frame[HISTOGRAM].values.tolist()
+        return frame.drop(columns=HISTOGRAM)
+
+    # item numbers whose summary does not match their reviews, empty if the summary table is consistent
+    # both directions are compared in one statement, so the writer cannot save a review in between
+    def check_summaries(self):
+        stored = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM item_summary"
+        rows = self._reader().execute(f"SELECT item_number FROM ({COMPUTE_SUMMARIES} EXCEPT {stored}) UNION "
+                                      f"SELECT item_number FROM ({stored} EXCEPT {COMPUTE_SUMMARIES})").fetchall()
+        return sorted(item_number for item_number, in rows)
+
+    # compute the summary table again from all reviews, e.g. after reviews were changed by hand
+    def rebuild_summaries(self):
+        connection = self._connect()
+        self._rebuild_summaries(connection)
+        connection.close()
+
+    def _rebuild_summaries(self, connection):
+        with connection:
+            connection.execute("DELETE FROM item_summary")
+            connection.execute(f"INSERT INTO item_summary ({', '.join(SUMMARY_COLUMNS)}) {COMPUTE_SUMMARIES}")
+
+    # save all reviews of a CSV or Parquet file (a path or an uploaded file), chunk by chunk
+    # the columns are the ones of the review page (Item Number, Name, Stars, Comment and optionally Date) or the
+    # database columns, rows with a missing field or stars outside 1 to 5 are skipped and reported, just like
+    # rows with an item number that is not in item_numbers (e.g. the item numbers of the catalog) if it is given
+    # every chunk goes through the duplicate check like the reviews of the page: reviews the same person already
+    # wrote (in the database or earlier in the file) are skipped and reported, almost the same reviews of somebody
+    # else are imported with a flag, unless check_duplicates is False
+    def import_reviews(self, source, file_format=None, chunk_size=CHUNK_SIZE, item_numbers=None,
+                       check_duplicates=True):
+        report = {"rows": 0, "imported": 0, "rejected": 0, "flagged": 0, "errors": []}
+        known = None if item_numbers is None else pd.Index(list(item_numbers), dtype=object)
+        connection = self._connect()
+        try:
+            for chunk in _read_chunks(source, file_format, chunk_size):
+                rows, row_numbers, errors = _validate(chunk, first_row=report["rows"] + 1, known=known)
+                checked = check_duplicates and bool(rows)
+                if checked:
+                    rows, duplicates = self._check_duplicates(rows, row_numbers)
+                    errors = sorted(errors + duplicates)
+                try:
+                    self._insert(connection, rows)
+                except Exception:
+                    # the chunk was not saved, so the duplicate check forgets it again
+                    if checked and rows:
+                        columns = list(zip(*rows))
+                        self.duplicates.forget_many(columns[0], columns[1], columns[3])
+                    raise
+                report["rows"] += len(chunk)
+                report["imported"] += len(rows)
+                report["rejected"] += len(errors)
+                report["flagged"] += sum(row[-1] for row in rows)
+                report["errors"] += errors[:REPORTED_ERRORS - len(report["errors"])]
+        finally:
+            connection.close()
+        return report
+
+    # the rows of an import without the duplicates and with the flag of possible spam set, and a (row number, reason)
+    # for every duplicate
+    def _check_duplicates(self, rows, row_numbers):
+        item_numbers, names, _, comments, _, _ = zip(*rows)
+        kept = []
+        duplicates = []
+        for row, row_number, (verdict, match) in zip(rows, row_numbers,
+                                                     self.duplicates.check_many(item_numbers, names, comments)):
+            if verdict == DUPLICATE:
+                duplicates.append((row_number, f"{match[0]} already wrote this review for the puzzle"))
+            else:
+                kept.append(row[:-1] + (int(verdict == FLAGGED),))
+        return kept, duplicates
+
+    # all reviews as DataFrames of up to chunk_size reviews, oldest first
+    # every chunk continues after the id of the last one, so reviews saved in the meantime do not shift the chunks
+    def iter_reviews(self, chunk_size=CHUNK_SIZE):
+        last = 0
+        while True:
+            rows = self._reader().execute(
+                "SELECT id, item_number, name, stars, comment, created_at FROM reviews WHERE id > ? ORDER BY id "
+                "LIMIT ?", (last, chunk_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield pd.DataFrame([row[1:] for row in rows], columns=list(COLUMNS.values()))
+
+    # id, item number, name and stars of at most limit reviews written after the review with the id after, oldest
+    # first, so a job can read only the reviews that are new since its last run
+    def stars_since(self, after=0, limit=CHUNK_SIZE):
+        return self._reader().execute("SELECT id, item_number, name, stars FROM reviews WHERE id > ? ORDER BY id "
+                                      "LIMIT ?", (after, limit)).fetchall()
+
+    # write all reviews to a CSV or Parquet file (a path or a binary file), chunk by chunk, returns the count
+    def export_reviews(self, target, file_format=None, chunk_size=CHUNK_SIZE):
+        file_format = file_format or _file_format(target)
+        count = 0
+        if file_format == "parquet":
+            pyarrow = _pyarrow()
+            writer = None
+            for chunk in self.iter_reviews(chunk_size):
+                table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                writer = writer or pyarrow.parquet.ParquetWriter(target, table.schema)
+                writer.write_table(table)
+                count += len(chunk)
+            if writer is None:
+                # an empty file still gets the columns
+                empty = pd.DataFrame({name: pd.Series(dtype="int64" if column == "stars" else "str")
+                                      for column, name in COLUMNS.items()})
+                pyarrow.parquet.write_table(pyarrow.Table.from_pandas(empty, preserve_index=False), target)
+            else:
+                writer.close()
+            return count
+
+        with open(target, "wb") if isinstance(target, str) else nullcontext(target) as file:
+            file.write((",".join(COLUMNS.values()) + "\n").encode())
+            for chunk in self.iter_reviews(chunk_size):
+                file.write(chunk.to_csv(header=False, index=False).encode())
+                count += len(chunk)
+        return count
+
+    # stop the writer thread after everything in the queue is saved
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+
+# "csv" or "parquet" from the name of a file
+def _file_format(source):
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    return "parquet" if str(name).lower().endswith(".parquet") else "csv"
+
+
+# pyarrow is only needed for Parquet files, so it is only imported when one is read or written
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet files need pyarrow, install it with pip install pyarrow") from None
+    return pyarrow
+
+
+# the rows of a CSV or Parquet file as DataFrames of up to chunk_size rows
+def _read_chunks(source, file_format, chunk_size):
+    if (file_format or _file_format(source)) == "parquet":
+        for batch in _pyarrow().parquet.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+# the valid rows of a chunk as tuples for the database, their row numbers in the file and a (row number, reason) for
+# every other row, first_row is the number of the first row of the chunk in the file, known are the allowed item
+# numbers or None
+def _validate(chunk, first_row, known=None):
+    chunk = chunk.rename(columns={name: column for column, name in COLUMNS.items()})
+    missing = [COLUMNS[column] for column in ("item_number", "name", "stars", "comment") if column not in chunk]
+    if missing:
+        raise ValueError(f"the file has no column {', '.join(missing)}")
+
+    if "created_at" not in chunk:
+        chunk["created_at"] = ""
+    fields = {column: chunk[column].fillna("").astype(str).str.strip()
+              for column in ("item_number", "name", "comment", "created_at")}
+    stars = pd.to_numeric(chunk["stars"], errors="coerce")
+
+    # the first problem of every row, an empty string for valid rows
+    reasons = pd.Series("", index=chunk.index)
+    for column in ("item_number", "name", "comment"):
+        reasons = reasons.mask(fields[column].eq("") & reasons.eq(""), f"{COLUMNS[column]} is empty")
+    reasons = reasons.mask(~stars.isin(STARS) & reasons.eq(""), "Stars must be a whole number from 1 to 5")
+    if known is not None:
+        reasons = reasons.mask(~fields["item_number"].isin(known) & reasons.eq(""), "Item Number is not in the catalog")
+    valid = reasons.eq("")
+
+    # reviews without a date get the time of the import
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    created_at = fields["created_at"][valid].mask(fields["created_at"][valid].eq(""), now)
+    rows = list(zip(fields["item_number"][valid].tolist(), fields["name"][valid].tolist(),
+                    stars[valid].astype(int).tolist(), fields["comment"][valid].tolist(), created_at.tolist(),
+                    repeat(0)))
+    row_numbers = (first_row + np.flatnonzero(valid.to_numpy())).tolist()
+    errors = [(first_row + int(position), reasons.iat[position]) for position in np.flatnonzero(~valid.to_numpy())]
+    return rows, row_numbers, errors
+
+if __name__ == "__main__":
+    # python review_store.py check finds summaries that do not match the reviews, rebuild computes them again,
+    # import and export read or write all reviews from or to a CSV or Parquet file
+    parser = argparse.ArgumentParser(description="Maintenance of the PuzzlePortal review database")
+    parser.add_argument("command", choices=["check", "rebuild", "import", "export"])
+    parser.add_argument("file", nargs="?", help="CSV or Parquet file for import and export")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="reviews read or written at a time")
+    parser.add_argument("--catalog", help="only import reviews of the puzzles in this catalog file")
+    args = parser.parse_args()
+    if args.command in ("import", "export") and not args.file:
+        parser.error(f"{args.command} needs a file")
+
+    store = ReviewStore()
+    if args.command == "rebuild":
+        store.rebuild_summaries()
+    if args.command == "import":
+        item_numbers = None
+        if args.catalog:
+            import puzzle_catalog
+            item_numbers = puzzle_catalog.read_catalog(args.catalog).by_item_number
+        report = store.import_reviews(args.file, chunk_size=args.chunk_size, item_numbers=item_numbers)
+        print(f"{report['imported']} of {report['rows']} reviews imported, {report['rejected']} rejected, "
+              f"{report['flagged']} flagged as possible spam")
+        for row, reason in report["errors"]:
+            print(f"  row {row}: {reason}")
+    elif args.command == "export":
+        print(f"{store.export_reviews(args.file, chunk_size=args.chunk_size)} reviews exported to {args.file}")
+    else:
+        mismatches = store.check_summaries()
+        print(f"{store.count()} reviews, {len(mismatches)} items with a wrong summary {mismatches[:10]}")
+    store.close()